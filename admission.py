@@ -0,0 +1,110 @@
+import contextlib
+import hashlib
+import json
+import threading
+import time
+from database import enqueue_llm_call, try_admit_llm_call, leave_llm_queue, release_llm_slot, join_llm_call, finish_llm_call
+
+#--- Admission Control Configuration ---
+ADMISSION_CONTROL = True     # queue LLM calls behind limits shared by every session and server process
+MAX_CONCURRENT_CALLS = 4     # LLM calls in flight at once across all processes
+CALLS_PER_SECOND = 1.0       # sustained rate of LLM calls across all processes
+CALL_BURST = 5               # calls allowed back to back before the rate applies
+SLOT_LEASE = 180.0           # seconds before a slot held by a crashed process is freed
+POLL_INTERVAL = 0.05         # seconds between checks while queued or waiting on an identical call
+RESULT_KEEP = 5.0            # seconds a finished call's result is served to late identical callers
+
+class AdmissionTimeout(Exception):
+    """Raised when an LLM call could not start (or an identical call did not finish) before its deadline."""
+
+_stats = {"admitted": 0, "timeouts": 0, "wait_seconds": 0.0, "coalesced": 0}
+_lock = threading.Lock()
+
+def configure_admission(max_concurrent=None, calls_per_second=None, burst=None):
+    """Sets the shared concurrency and rate limits."""
+    global MAX_CONCURRENT_CALLS, CALLS_PER_SECOND, CALL_BURST
+    if max_concurrent is not None:
+        MAX_CONCURRENT_CALLS = int(max_concurrent)
+    if calls_per_second is not None:
+        CALLS_PER_SECOND = float(calls_per_second)
+    if burst is not None:
+        CALL_BURST = int(burst)
+
+def _count(name, amount=1):
+    """Adds to one of the admission counters."""
+    with _lock:
+        _stats[name] += amount
+
+#--- Admission Functions ---
+@contextlib.contextmanager
+def admit(timeout):
+    """Waits in the shared queue until the call may start, holding its slot for the enclosed block.
+
+    Raises AdmissionTimeout if no slot and rate-limit token came free within
+    `timeout` seconds.
+    """
+    if not ADMISSION_CONTROL:
+        yield
+        return
+    started = time.monotonic()
+    #wall-clock time, since the deadline is compared in other processes too
+    give_up_at = time.time() + timeout
+    ticket = enqueue_llm_call(give_up_at)
+    slot_id = None
+    try:
+        while True:
+            slot_id, wait = try_admit_llm_call(ticket, MAX_CONCURRENT_CALLS, CALLS_PER_SECOND, CALL_BURST, SLOT_LEASE)
+            if slot_id is not None:
+                break
+            remaining = give_up_at - time.time()
+            if remaining <= 0:
+                _count("timeouts")
+                raise AdmissionTimeout(f"No LLM call slot came free within {timeout:.1f}s.")
+            time.sleep(min(max(wait, POLL_INTERVAL), remaining))
+    finally:
+        if slot_id is None:
+            leave_llm_queue(ticket)
+    _count("admitted")
+    _count("wait_seconds", time.monotonic() - started)
+    try:
+        yield
+    finally:
+        release_llm_slot(slot_id)
+
+#--- Request Coalescing Functions ---
+def call_key(messages, params):
+    """Returns a key identifying an LLM request, so identical requests can share one call."""
+    return hashlib.sha256(json.dumps([messages, params], sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def join_call(key, timeout):
+    """Waits for an identical call already in flight and returns its result.
+
+    Returns None when there is no such call; the caller must then make the
+    call itself and report back with finish_call. Raises AdmissionTimeout if
+    the identical call is still running after `timeout` seconds.
+    """
+    if not ADMISSION_CONTROL:
+        return None
+    give_up_at = time.time() + timeout
+    while True:
+        leader, result = join_llm_call(key, give_up_at)
+        if leader:
+            return None
+        if result is not None:
+            _count("coalesced")
+            return result
+        remaining = give_up_at - time.time()
+        if remaining <= 0:
+            _count("timeouts")
+            raise AdmissionTimeout(f"An identical LLM call did not finish within {timeout:.1f}s.")
+        time.sleep(min(POLL_INTERVAL, remaining))
+
+def finish_call(key, result=None):
+    """Hands a call's result to the callers waiting on it, or (result None, after a failure) lets the next one try."""
+    if ADMISSION_CONTROL:
+        finish_llm_call(key, result, RESULT_KEEP)
+
+def get_admission_stats():
+    """Returns counters of admitted, timed-out and coalesced calls and of time spent queued."""
+    with _lock:
+        return dict(_stats)
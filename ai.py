@@ -0,0 +1,136 @@
+import streamlit as st
+import random
+import textwrap
+from llm import chat_completion, stream_chat_completion, CircuitOpen
+from ai_cache import normalize_text, make_cache_key, get_cached, put_cached
+from token_budget import fit_to_budget, condense_text
+
+#--- AI Configuration ---
+AI_MODEL = "gpt-4o"
+PROMPT_VERSION = 2   # bump whenever build_prompt changes so cached responses are not reused
+MAX_RESPONSE_TOKENS = 200
+AI_STREAMING = True  # stream tokens so the insight appears while it is being written
+AI_RELATED_CONTEXT = False  # show the model the writer's most similar past entries alongside the new one
+RELATED_CONTEXT_BUDGET = 150  # tokens each past entry is condensed to when passed as context
+SYSTEM_PROMPT = "You are a creative, empathetic AI journal assistant."
+FALLBACK_RESPONSES = [
+    "Your thoughts are a garden, adn every entry is a seed. Keep nurturing them, and they will blossom into something beautiful.",
+    "Remember that even the most beautiful stories have chapters of quiet moments. Your journey is uniquelyyours, and every page is worth writing.",
+    "Take a deep breath and know that you are capable of incredible things. This moment is just a step on your path.",
+    "Every day is a fresh start, a blank page waiting for your words. Embrace the new beginning."
+]
+
+#The template is dedented once here rather than on every call; the entry is
+#substituted afterwards, so a multi-line entry no longer defeats the dedent.
+PROMPT_TEMPLATE = textwrap.dedent("""
+    You are MindScribe - an AI-powered journal assistant.
+    your mission is to take the user's journal entry and transform it into something that sparks powerful emotions.
+    Choose one of the following formats:
+    - A Poem
+    - A motivational quote
+    - A short humorous dramatic story
+    - A one-act play
+
+    Guidelines:
+    - The response must feel personal and directly inspired by the user's journal entry.
+    - The tone can be motivational (fire-in-the-soul energy), humorous (laugh-out-loud funny), dramatic (mini stage-play), or uplifting (heartwarming).
+    - Make it engaging, creative, and memorable - the kind of response that either makes the user laugh so hard that can't stop, or feel unstoppable motivation to conquer their goals.
+
+    Here is the journal entry:
+    \"\"\"{entry_text}\"\"\"
+
+    {past_entries}Now, generate a creative response in ONE of the above formats that will either inspire, motivate or bring deep joy to the user.
+    """)
+
+#--- AI Functions ---
+def _past_entries_section(past_entries):
+    """Formats related past entries for the prompt, each condensed to a small budget."""
+    if not past_entries:
+        return ""
+    quoted = "\n".join(f'- "{condense_text(text, RELATED_CONTEXT_BUDGET)}"' for text in past_entries)
+    return f"For context, here are related entries they wrote before:\n{quoted}\n\n"
+
+def build_prompt(entry_text, past_entries=()):
+    """Builds the user prompt for a journal entry, condensing entries over the token budget."""
+    return PROMPT_TEMPLATE.format(entry_text=fit_to_budget(entry_text), past_entries=_past_entries_section(past_entries))
+
+def build_messages(entry_text, past_entries=()):
+    """Builds the chat messages sent to the model for a journal entry."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(entry_text, past_entries)}
+    ]
+
+def request_ai_response(entry_text, past_entries=()):
+    """Calls the LLM backend for a journal entry and returns the text, raising on any failure."""
+    return chat_completion(build_messages(entry_text, past_entries), model=AI_MODEL, temperature=0.8, max_tokens=MAX_RESPONSE_TOKENS).strip()
+
+class StreamInterrupted(Exception):
+    """Raised when a streamed response is cut off before the model finished it."""
+
+    def __init__(self, message, partial_text=""):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+def stream_ai_response(entry_text, past_entries=()):
+    """Streams the LLM response for a journal entry, yielding text as it arrives.
+
+    Raises StreamInterrupted (carrying the text received so far) if the stream
+    breaks off or ends without a finish reason.
+    """
+    received = []
+    finished = False
+    try:
+        for delta, finish_reason in stream_chat_completion(build_messages(entry_text, past_entries), model=AI_MODEL, temperature=0.8, max_tokens=MAX_RESPONSE_TOKENS):
+            if delta:
+                received.append(delta)
+                yield delta
+            if finish_reason:
+                finished = True
+    except Exception as e:
+        if not received:
+            raise
+        raise StreamInterrupted(f"AI stream cut off: {e}", "".join(received)) from e
+    if not finished:
+        raise StreamInterrupted("AI stream ended without a finish reason", "".join(received))
+
+def fallback_response():
+    """Picks one of the canned responses used when the API is unavailable."""
+    return random.choice(FALLBACK_RESPONSES)
+
+def response_cache_key(entry_text, mood=None, past_entries=()):
+    """Returns the cache key for an entry's AI response under the current model and prompt."""
+    if past_entries:
+        return make_cache_key(normalize_text(entry_text), mood, AI_MODEL, PROMPT_VERSION, *map(normalize_text, past_entries))
+    return make_cache_key(normalize_text(entry_text), mood, AI_MODEL, PROMPT_VERSION)
+
+def related_context(user_id, entry_text, exclude=()):
+    """Returns the texts of a user's past entries most similar to entry_text, for use as prompt context."""
+    from related import related_entries
+    from database import get_entry
+    texts = []
+    for entry_id, _ in related_entries(user_id, entry_text, exclude=exclude):
+        entry = get_entry(user_id, entry_id)
+        if entry is not None:
+            texts.append(entry[0])
+    return texts
+
+def generate_ai_response(entry_text, mood=None, past_entries=()):
+    """
+    Generates a creative, personalized AI response based on the journal entry.
+    This function uses the configured LLM backend. If the API fails, it provides a fallback message.
+    past_entries optionally gives the model related earlier entries (see related_context).
+    """
+    cache_key = response_cache_key(entry_text, mood, past_entries)
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return cached
+    try:
+        ai_response = request_ai_response(entry_text, past_entries)
+    except CircuitOpen:
+        return fallback_response()
+    except Exception as e:
+        st.error(f"AI Error: {e}")
+        return fallback_response()
+    put_cached(cache_key, ai_response)
+    return ai_response
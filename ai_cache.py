@@ -0,0 +1,74 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from database import get_cached_ai_response, put_cached_ai_response, evict_cached_ai_responses
+
+#--- AI Response Cache Configuration ---
+MEMORY_CACHE_SIZE = 512       # responses kept in the in-process LRU tier
+CACHE_TTL = 30 * 24 * 3600    # seconds a cached response stays valid
+CACHE_MAX_ROWS = 20000        # rows kept in the SQLite tier
+EVICT_EVERY = 200             # stores between size/TTL sweeps of the SQLite tier
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+#--- AI Response Cache Functions ---
+def normalize_text(text):
+    """Normalizes entry text so trivially different entries (case, spacing, trailing punctuation) share a key."""
+    return " ".join(text.lower().split()).strip(" .!?,;:")
+
+def make_cache_key(*parts):
+    """Hashes the given key parts into a content-addressed cache key."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+def get_cached(cache_key):
+    """Looks a response up in memory, then in SQLite. Returns None on a miss."""
+    now = time.time()
+    with _lock:
+        hit = _memory.get(cache_key)
+        if hit is not None and now - hit[1] < CACHE_TTL:
+            _memory.move_to_end(cache_key)
+            _stats["memory_hits"] += 1
+            return hit[0]
+    row = get_cached_ai_response(cache_key, now - CACHE_TTL)
+    with _lock:
+        if row is None:
+            _stats["misses"] += 1
+            return None
+        response, created_at = row
+        _stats["db_hits"] += 1
+        #kept under the row's own age, so the memory tier never outlives CACHE_TTL
+        _remember(cache_key, response, created_at)
+    return response
+
+def put_cached(cache_key, response):
+    """Stores a response in both cache tiers, sweeping the SQLite tier every EVICT_EVERY stores."""
+    now = time.time()
+    put_cached_ai_response(cache_key, response)
+    with _lock:
+        _remember(cache_key, response, now)
+        _stats["stores"] += 1
+        sweep = _stats["stores"] % EVICT_EVERY == 0
+    if sweep:
+        removed = evict_cached_ai_responses(now - CACHE_TTL, CACHE_MAX_ROWS)
+        with _lock:
+            _stats["evicted"] += removed
+
+def _remember(cache_key, response, created_at):
+    """Adds a response created at created_at to the memory tier, evicting the least recently used one when full. Caller holds _lock."""
+    _memory[cache_key] = (response, created_at)
+    _memory.move_to_end(cache_key)
+    while len(_memory) > MEMORY_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+def get_cache_stats():
+    """Returns hit/miss counters and the hit rate of the response cache."""
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_size"] = len(_memory)
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+    return stats
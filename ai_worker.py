@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+import ai
+from database import claim_ai_job, complete_ai_job, retry_ai_job, update_ai_job_progress
+from ai import request_ai_response, stream_ai_response, fallback_response, response_cache_key, related_context, StreamInterrupted
+from llm import CircuitOpen
+from ai_cache import get_cached, put_cached
+
+#--- Background Worker Configuration ---
+WORKER_COUNT = 2         # AI jobs generated in parallel per server process
+POLL_INTERVAL = 5.0      # seconds an idle worker sleeps before checking the queue again
+JOB_LEASE = 120.0        # seconds before a job held by a dead worker is picked up again
+MAX_ATTEMPTS = 3         # API attempts before an entry gets a fallback response
+RETRY_DELAY = 10.0       # seconds, multiplied by the attempt number
+STREAM_FLUSH_INTERVAL = 0.3  # seconds between saves of a streaming response's progress
+
+logger = logging.getLogger(__name__)
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+#--- Background Worker Functions ---
+def _generate(job_id, content, past_entries):
+    """Generates the AI response for a job, saving streamed progress as it arrives."""
+    if not ai.AI_STREAMING:
+        return request_ai_response(content, past_entries)
+    parts = []
+    last_flush = time.monotonic()
+    for delta in stream_ai_response(content, past_entries):
+        parts.append(delta)
+        if time.monotonic() - last_flush >= STREAM_FLUSH_INTERVAL:
+            update_ai_job_progress(job_id, "".join(parts))
+            last_flush = time.monotonic()
+    return "".join(parts).strip()
+
+def process_next_job():
+    """Claims one pending AI job and fills in its entry's response. Returns False when the queue is empty."""
+    job = claim_ai_job(JOB_LEASE, MAX_ATTEMPTS, fallback_response)
+    if job is None:
+        return False
+    job_id, entry_id, user_id, content, mood, attempts = job
+    #everything after the claim is inside the try, so any failure retries the job (or, on the last attempt, finishes it)
+    try:
+        past_entries = related_context(user_id, content, exclude={entry_id}) if ai.AI_RELATED_CONTEXT else ()
+        cache_key = response_cache_key(content, mood, past_entries)
+        ai_response = get_cached(cache_key)
+        if ai_response is None:
+            ai_response = _generate(job_id, content, past_entries)
+            put_cached(cache_key, ai_response)
+        complete_ai_job(job_id, entry_id, ai_response)
+    except Exception as e:
+        #while the circuit is open the upstream is down, so answer right away
+        if attempts >= MAX_ATTEMPTS or isinstance(e, CircuitOpen):
+            logger.warning("AI job %s failed after %s attempt(s), using a fallback response: %s", job_id, attempts, e)
+            #on the last attempt a cut-off stream is still better than a canned reply
+            partial_text = e.partial_text.strip() if isinstance(e, StreamInterrupted) else ""
+            ai_response = partial_text + "…" if partial_text else fallback_response()
+            complete_ai_job(job_id, entry_id, ai_response, status="failed", error=str(e))
+        else:
+            retry_ai_job(job_id, RETRY_DELAY * attempts, str(e))
+    return True
+
+def _worker_loop():
+    """Runs AI jobs until the process exits, sleeping while the queue is empty."""
+    while True:
+        try:
+            if process_next_job():
+                continue
+        except Exception:
+            logger.exception("AI worker crashed while processing a job")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+def notify_workers():
+    """Wakes idle workers so a freshly queued job starts without waiting for the next poll."""
+    _wakeup.set()
+
+def start_workers(count=WORKER_COUNT):
+    """Starts the background AI worker threads once per server process."""
+    with _workers_lock:
+        if not _workers:
+            for i in range(count):
+                worker = threading.Thread(target=_worker_loop, name=f"ai-worker-{i}", daemon=True)
+                worker.start()
+                _workers.append(worker)
+    return _workers
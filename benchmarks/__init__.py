@@ -0,0 +1,9 @@
+"""Benchmarks and load tests for MindScribe's data functions and page renders.
+
+Generate a synthetic database and run the suite from the repository root:
+
+    python -m benchmarks.generate_data --users 20 --years 3 --db bench.db
+    python -m benchmarks.run_benchmarks --db bench.db --output results.json
+    python -m benchmarks.run_benchmarks --db bench.db --compare results.json
+    python -m benchmarks.load_test --db bench.db --sessions 8 --rounds 5
+"""
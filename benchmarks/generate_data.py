@@ -0,0 +1,99 @@
+"""Creates a journal database full of synthetic users and daily entries."""
+import argparse
+import datetime
+import glob
+import os
+import random
+import shutil
+import database
+from compression import compress_text
+from database import hash_password, init_db, get_connection, close_all_connections, admission_path, rebuild_rollups, analyze_tables, _backfill_daily_activity, rebuild_search_index
+from query_cache import clear_query_cache
+
+#--- Generator Configuration ---
+BENCH_PASSWORD = "benchmark"  # every generated user logs in with this password
+MOOD_WEIGHTS = {"Happy": 0.3, "Neutral": 0.25, "Excited": 0.15, "Anxious": 0.15, "Sad": 0.15}
+SKIP_DAY_RATE = 0.15          # fraction of days without an entry, so streaks break now and then
+SECOND_ENTRY_RATE = 0.05      # fraction of days with a second entry
+MEDIAN_WORDS = 120            # entry length follows a log-normal distribution around this
+WORDS = (
+    "today I felt really tired but also grateful for the small things like coffee with a friend "
+    "work was busy and the meeting ran long so I went for a walk after lunch to clear my head "
+    "I keep thinking about the trip next month and whether I should call my sister about it "
+    "the weather turned cold and rainy which made the evening quiet and a little lonely "
+    "finished the book finally and cooked dinner while listening to music in the kitchen "
+    "anxious about the deadline tomorrow though I made good progress on the project this afternoon "
+    "slept badly again woke up at four and could not stop planning the week ahead"
+).split()
+
+def _entry_text(rng):
+    """Returns one entry of realistic length made of everyday journaling words."""
+    words = max(5, int(rng.lognormvariate(0, 0.6) * MEDIAN_WORDS))
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(6, 18))
+        sentence = " ".join(rng.choices(WORDS, k=length))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        words -= length
+    return " ".join(sentences)
+
+def _user_entries(rng, user_id, start, end):
+    """Yields (user_id, date, content, mood, ai_response) rows for every journaled day of one user."""
+    moods, weights = list(MOOD_WEIGHTS), list(MOOD_WEIGHTS.values())
+    day = start
+    while day <= end:
+        if rng.random() >= SKIP_DAY_RATE:
+            for _ in range(2 if rng.random() < SECOND_ENTRY_RATE else 1):
+                content = _entry_text(rng)
+                ai_response = "A Poem:\n" + " ".join(content.split()[:30])
+                yield user_id, day.isoformat(), compress_text(content), rng.choices(moods, weights)[0], compress_text(ai_response)
+        day += datetime.timedelta(days=1)
+
+def generate_journal_db(path, users=10, years=1, seed=0, end_date=None):
+    """Creates (or replaces) a database at path with users x years of daily entries. Returns the user IDs."""
+    #pooled connections would keep writing to the files removed below
+    close_all_connections()
+    clear_query_cache()
+    database.configure_database(path=path)
+    root = os.path.splitext(path)[0]
+    #the shards, LLM admission state and vector indexes of an earlier dataset go too
+    for db_file in [path, admission_path()] + glob.glob(f"{glob.escape(root)}-shard-*.db"):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+    shutil.rmtree(root + "-vectors", ignore_errors=True)
+    rng = random.Random(seed)
+    end = end_date or datetime.date.today()
+    start = end - datetime.timedelta(days=365 * years - 1)
+    init_db()
+    user_ids = []
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for n in range(users):
+            cursor = conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (f"user{n}", hash_password(BENCH_PASSWORD)))
+            user_ids.append(cursor.lastrowid)
+            conn.executemany(
+                "INSERT INTO entries (user_id, date, content, mood, ai_response) VALUES (?, ?, ?, ?, ?)",
+                _user_entries(rng, cursor.lastrowid, start, end),
+            )
+        rebuild_rollups(conn)
+        _backfill_daily_activity(conn)
+        rebuild_search_index(conn)
+    with get_connection() as conn:
+        analyze_tables(conn)
+    return user_ids
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic MindScribe journal database.")
+    parser.add_argument("--db", default="bench.db", help="path of the database to create (replaced if it exists)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--years", type=int, default=1, help="years of daily entries per user")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    user_ids = generate_journal_db(args.db, args.users, args.years, args.seed)
+    with get_connection() as conn:
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    print(f"Wrote {len(user_ids)} users and {entries} entries to {args.db}.")
+
+if __name__ == "__main__":
+    main()
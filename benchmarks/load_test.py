@@ -0,0 +1,270 @@
+"""Drives concurrent simulated journalers through the real pages and reports latency percentiles.
+
+Each simulated user runs in its own process with its own AppTest session
+(AppTest is not safe to run from several threads), logs in, unlocks its
+journal, then saves an entry, waits for the AI insight, opens the entry on
+the dashboard and deletes it again, --rounds times. The AI insights come
+from the background workers of this process, talking to the local mock LLM
+server, so the sessions share one worker pool like the sessions of one app
+instance do.
+
+    python -m benchmarks.load_test --db bench.db --sessions 8 --rounds 5
+"""
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+import database
+import ai_worker
+from database import get_connection, get_user_id, set_security_key
+from llm import configure_llm
+from metrics import get_lock_wait_stats
+from mock_llm_server import start_mock_server
+from benchmarks.generate_data import BENCH_PASSWORD, generate_journal_db, _entry_text
+from benchmarks.run_benchmarks import APP_SCRIPT, _git_commit
+
+#--- Load Test Configuration ---
+SESSIONS = 4                 # simulated journalers running at once
+ROUNDS = 3                   # save / insight / delete rounds per journaler after logging in
+LOAD_PASSCODE = "2468"       # security key given to every load-test user
+MOCK_LATENCY = 0.5           # mean seconds the mock LLM takes before its first token
+THINK_TIME = 0.0             # seconds a simulated user pauses between actions
+AI_WAIT_TIMEOUT = 30.0       # seconds to wait for an AI insight before counting it as an error
+AI_POLL = 0.1                # seconds between reruns while waiting for an insight
+WORKER_POLL = 0.1            # the shared AI workers poll the queue this often (sessions in other processes cannot wake them)
+PERCENTILES = (50, 95, 99)
+
+#--- Simulated User ---
+class ActionFailed(Exception):
+    """Raised when a page did not react to a simulated action the way a user would expect."""
+
+def _button(app, label):
+    """Returns the button with a label, failing the action if the page does not show it."""
+    for button in app.button:
+        if button.label == label:
+            return button
+    raise ActionFailed(f"no '{label}' button on the {app.session_state['page']} page")
+
+def _check(app, page=None):
+    """Fails the action if the rerun raised or did not end on the expected page."""
+    if app.exception:
+        raise ActionFailed(app.exception[0].message)
+    if page is not None and app.session_state["page"] != page:
+        raise ActionFailed(f"expected the {page} page, got {app.session_state['page']}")
+
+def _wait_for_insight(app):
+    """Reruns the journal page until the AI insight of the saved entry is shown."""
+    give_up_at = time.monotonic() + AI_WAIT_TIMEOUT
+    #the page clears pending_entry_id in the rerun that shows the insight
+    while app.session_state["pending_entry_id"] is not None:
+        if time.monotonic() > give_up_at:
+            raise ActionFailed(f"no AI insight after {AI_WAIT_TIMEOUT:.0f}s")
+        time.sleep(AI_POLL)
+        app.run()
+        _check(app, "journal")
+
+def simulate_user(spec):
+    """Runs one simulated journaler in this process. Returns its timings, errors and lock-wait counters."""
+    from streamlit.testing.v1 import AppTest
+    database.DB_PATH = spec["db"]
+    #under load every rerun is over its budget; the report covers what those warnings would say
+    logging.disable(logging.WARNING)
+    #AI insights are written by the coordinating process's workers
+    ai_worker.start_workers = lambda count=0: []
+    rng = random.Random(spec["seed"])
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=60)
+    app.secrets.update(OPENAI_API_KEY="load-test", LLM_BACKEND="http", LLM_API_URL=spec["llm_url"])
+    timings = []
+    errors = []
+
+    def act(name, action):
+        """Times one user action; a failed action ends this user's run."""
+        if THINK_TIME:
+            time.sleep(rng.uniform(0, 2 * THINK_TIME))
+        started = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            errors.append((name, str(e)))
+            raise
+        timings.append((name, time.perf_counter() - started))
+
+    def login():
+        app.text_input(key="login_username").input(spec["username"])
+        app.text_input(key="login_password").input(BENCH_PASSWORD)
+        _button(app, "Login").click().run()
+        _check(app, "security_check")
+
+    def unlock():
+        app.text_input(key="check_passcode").input(LOAD_PASSCODE)
+        _button(app, "Unlock").click().run()
+        _check(app, "welcome")
+
+    def open_journal():
+        if app.session_state["page"] == "welcome":
+            _button(app, "Start Journaling").click().run()
+        else:
+            #after a delete's fragment-only rerun AppTest only holds the rerun
+            #fragments' elements, so do what the "Write New Entry" button does
+            app.session_state["page"] = "journal"
+            app.run()
+        _check(app, "journal")
+
+    saved = {}
+    def save():
+        app.text_area[0].input(_entry_text(rng))
+        app.selectbox[0].select(rng.choice(app.selectbox[0].options))
+        _button(app, "Save Entry").click().run()
+        _check(app, "journal")
+        saved["id"] = app.session_state["pending_entry_id"]
+        if saved["id"] is None:
+            raise ActionFailed("the entry was not saved")
+
+    def go_home():
+        _button(app, "Back to Home").click().run()
+        _check(app, "home")
+
+    def open_entry():
+        app.session_state[f"entry_{saved['id']}"] = True
+        app.run()
+        _check(app, "home")
+
+    def delete():
+        for button in app.button:
+            if button.key == f"entry_delete_{saved['id']}":
+                button.click().run()
+                _check(app, "home")
+                return
+        raise ActionFailed(f"entry {saved['id']} is not on the first dashboard page")
+
+    started = time.perf_counter()
+    rounds_done = 0
+    try:
+        act("load_login_page", lambda: (app.run(), _check(app, "login")))
+        act("login", login)
+        act("unlock", unlock)
+        for _ in range(spec["rounds"]):
+            act("open_journal", open_journal)
+            act("save_entry", save)
+            act("ai_insight", lambda: _wait_for_insight(app))
+            act("home_page", go_home)
+            act("open_entry", open_entry)
+            act("delete_entry", delete)
+            rounds_done += 1
+    except Exception:
+        pass
+    return {
+        "timings": timings,
+        "errors": errors,
+        "rounds": rounds_done,
+        "seconds": time.perf_counter() - started,
+        "lock_waits": get_lock_wait_stats(),
+    }
+
+#--- Load Test Functions ---
+def percentile(values, pct):
+    """Returns the nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * pct // 100) - 1))]
+
+def _prepare_users(sessions):
+    """Gives the first `sessions` generated users the load-test security key. Returns their usernames."""
+    with get_connection() as conn:
+        users = conn.execute("SELECT username FROM users WHERE username LIKE 'user%' ORDER BY id LIMIT ?", (sessions,)).fetchall()
+    if len(users) < sessions:
+        raise SystemExit(f"The database has {len(users)} generated users; --sessions {sessions} needs one per session.")
+    for (username,) in users:
+        set_security_key(get_user_id(username), LOAD_PASSCODE)
+    return [username for (username,) in users]
+
+def _merge_lock_waits(stats):
+    """Adds up write-lock counters from several processes."""
+    total = {"acquired": 0, "waited": 0, "timeouts": 0, "seconds": 0.0, "max_seconds": 0.0}
+    for item in stats:
+        for key in ("acquired", "waited", "timeouts", "seconds"):
+            total[key] += item[key]
+        total["max_seconds"] = max(total["max_seconds"], item["max_seconds"])
+    return total
+
+def run_load_test(db_path, sessions=SESSIONS, rounds=ROUNDS, mock_latency=MOCK_LATENCY, seed=0):
+    """Runs `sessions` simulated journalers at once against db_path and returns the results dictionary."""
+    database.DB_PATH = db_path
+    usernames = _prepare_users(sessions)
+    server, llm_url = start_mock_server(latency=mock_latency)
+    configure_llm(backend="http", api_url=llm_url, api_key="load-test")
+    ai_worker.POLL_INTERVAL = WORKER_POLL
+    ai_worker.start_workers()
+    specs = [
+        {"db": db_path, "username": username, "rounds": rounds, "llm_url": llm_url, "seed": seed * 1000 + n}
+        for n, username in enumerate(usernames)
+    ]
+    started = time.perf_counter()
+    #spawn rather than fork: this process already runs worker and server threads
+    with multiprocessing.get_context("spawn").Pool(sessions) as pool:
+        users = pool.map(simulate_user, specs)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    actions = {}
+    for user in users:
+        for name, seconds in user["timings"]:
+            actions.setdefault(name, []).append(seconds * 1000)
+    errors = [error for user in users for error in user["errors"]]
+    rounds_done = sum(user["rounds"] for user in users)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sessions": sessions,
+        "rounds_per_session": rounds,
+        "mock_latency": mock_latency,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": {
+            "rounds_per_second": round(rounds_done / elapsed, 3),
+            "actions_per_second": round(sum(len(timings) for timings in actions.values()) / elapsed, 3),
+        },
+        "actions": {
+            name: {"count": len(timings), **{f"p{pct}_ms": round(percentile(timings, pct), 1) for pct in PERCENTILES}, "max_ms": round(max(timings), 1)}
+            for name, timings in actions.items()
+        },
+        "errors": errors,
+        #the sessions' processes plus this one, where the AI workers run
+        "lock_waits": _merge_lock_waits([user["lock_waits"] for user in users] + [get_lock_wait_stats()]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test MindScribe with concurrent simulated journalers.")
+    parser.add_argument("--db", default="bench.db", help="database to load (generated if missing)")
+    parser.add_argument("--users", type=int, default=10, help="users to generate when --db does not exist")
+    parser.add_argument("--years", type=int, default=1, help="years of entries to generate when --db does not exist")
+    parser.add_argument("--sessions", type=int, default=SESSIONS, help="simulated journalers running at once")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="save/delete rounds per journaler")
+    parser.add_argument("--mock-latency", type=float, default=MOCK_LATENCY, help="mean seconds the mock LLM takes to answer")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        print(f"Generating {args.db} ({max(args.users, args.sessions)} users, {args.years} year(s))...")
+        generate_journal_db(args.db, max(args.users, args.sessions), args.years)
+    results = run_load_test(args.db, args.sessions, args.rounds, args.mock_latency)
+    print(f"{results['sessions']} sessions x {results['rounds_per_session']} rounds in {results['elapsed_seconds']:.1f}s")
+    print(f"{'action':16} {'count':>5} " + " ".join(f"{'p' + str(pct):>9}" for pct in PERCENTILES) + f" {'max':>9}   (ms)")
+    for name, stats in results["actions"].items():
+        print(f"{name:16} {stats['count']:5d} " + " ".join(f"{stats[f'p{pct}_ms']:9.1f}" for pct in PERCENTILES) + f" {stats['max_ms']:9.1f}")
+    throughput = results["throughput"]
+    print(f"throughput: {throughput['rounds_per_second']:.2f} journaling rounds/s, {throughput['actions_per_second']:.2f} actions/s")
+    locks = results["lock_waits"]
+    print(f"SQLite write locks: {locks['acquired']} taken, {locks['waited']} waited on another writer, "
+          f"{locks['timeouts']} timed out; {locks['seconds'] * 1000:.1f} ms waiting in total, longest {locks['max_seconds'] * 1000:.1f} ms")
+    for name, error in results["errors"]:
+        print(f"error in {name}: {error}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}.")
+    if results["errors"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Times MindScribe's data functions and page renders and writes the results as JSON."""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import database
+from database import get_connection, login_user, save_entry, delete_entry, get_all_entries, get_entry_dates, get_entry_headers, search_entries
+from query_cache import clear_query_cache
+from benchmarks.generate_data import BENCH_PASSWORD, generate_journal_db
+
+#--- Benchmark Configuration ---
+REPEAT = 20                  # timed runs per benchmark, after one warm-up run
+PAGE_REPEAT = 5              # page renders are slower, so they get fewer runs
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+REGRESSION_THRESHOLD = 1.2   # --compare flags a benchmark whose median grew by more than this factor
+
+#--- Benchmark Functions ---
+def _time(func, repeat, setup=None):
+    """Runs func once to warm up, then repeat more times. Returns the timings in milliseconds."""
+    timings = []
+    for i in range(repeat + 1):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        if i:
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def _summary(timings):
+    """Reduces a list of timings to the statistics stored in the results file."""
+    ordered = sorted(timings)
+    return {
+        "runs": len(ordered),
+        "median_ms": round(statistics.median(ordered), 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "min_ms": round(ordered[0], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+
+def _busiest_user():
+    """Returns (user_id, username) of the user with the most entries."""
+    with get_connection() as conn:
+        return conn.execute("""
+            SELECT users.id, users.username FROM users JOIN user_totals ON user_totals.user_id = users.id
+            ORDER BY user_totals.entry_count DESC LIMIT 1
+        """).fetchone()
+
+def bench_data_functions(user_id, username, repeat=REPEAT):
+    """Times the database functions behind the dashboard, bypassing the per-user query cache."""
+    results = {}
+    reads = {
+        "get_all_entries": lambda: get_all_entries.__wrapped__(user_id),
+        "get_entry_dates": lambda: get_entry_dates.__wrapped__(user_id),
+        "get_entry_headers": lambda: get_entry_headers.__wrapped__(user_id),
+        "search_entries": lambda: search_entries.__wrapped__(user_id, "coffee friend"),
+        "login_user": lambda: login_user(username, BENCH_PASSWORD),
+    }
+    for name, func in reads.items():
+        results[name] = _summary(_time(func, repeat))
+    #save_entry includes streak and rollup maintenance; each saved entry is removed
+    #again untimed so every run sees the same database
+    saved = []
+    def save():
+        saved.append(save_entry(user_id, "Benchmark entry about coffee with a friend.", "Happy", "A Poem"))
+    def cleanup():
+        while saved:
+            delete_entry(saved.pop())
+    results["save_entry"] = _summary(_time(save, repeat, setup=cleanup))
+    cleanup()
+    return results
+
+def bench_pages(user_id, repeat=PAGE_REPEAT):
+    """Times full reruns of the home and journal pages through Streamlit's AppTest harness.
+
+    "cold" runs clear the query cache first so every read goes to SQLite;
+    "warm" runs are plain reruns served from the cache.
+    """
+    from streamlit.testing.v1 import AppTest
+    results = {}
+    for page in ("home", "journal"):
+        app = AppTest.from_file(APP_SCRIPT, default_timeout=60)
+        app.secrets["OPENAI_API_KEY"] = "benchmark"
+        app.session_state.logged_in = True
+        app.session_state.user_id = user_id
+        app.session_state.page = page
+        def render():
+            app.run()
+            if app.exception:
+                raise RuntimeError(f"{page} page raised: {app.exception[0].message}")
+        results[f"{page}_page_cold"] = _summary(_time(render, repeat, setup=clear_query_cache))
+        results[f"{page}_page_warm"] = _summary(_time(render, repeat))
+    return results
+
+def _git_commit():
+    """Returns the current git commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(db_path, repeat=REPEAT, page_repeat=PAGE_REPEAT, pages=True):
+    """Runs the whole suite against db_path and returns the results dictionary."""
+    database.DB_PATH = db_path
+    clear_query_cache()
+    user_id, username = _busiest_user()
+    with get_connection() as conn:
+        users, entries = conn.execute("SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM entries)").fetchone()
+    results = bench_data_functions(user_id, username, repeat)
+    if pages:
+        results.update(bench_pages(user_id, page_repeat))
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": database.sqlite3.sqlite_version,
+        "dataset": {"users": users, "entries": entries, "benchmark_user_entries": len(get_entry_dates.__wrapped__(user_id))},
+        "benchmarks": results,
+    }
+
+def compare_results(baseline, current):
+    """Returns (name, baseline median, current median, ratio) rows, slowest-growing first."""
+    rows = []
+    for name, stats in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before:
+            ratio = stats["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+            rows.append((name, before["median_ms"], stats["median_ms"], ratio))
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MindScribe's data functions and page renders.")
+    parser.add_argument("--db", default="bench.db", help="database to benchmark (generated if missing)")
+    parser.add_argument("--users", type=int, default=10, help="users to generate when --db does not exist")
+    parser.add_argument("--years", type=int, default=1, help="years of entries to generate when --db does not exist")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--page-repeat", type=int, default=PAGE_REPEAT)
+    parser.add_argument("--no-pages", action="store_true", help="skip the AppTest page renders")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        print(f"Generating {args.db} ({args.users} users, {args.years} year(s))...")
+        generate_journal_db(args.db, args.users, args.years)
+    results = run_benchmarks(args.db, args.repeat, args.page_repeat, pages=not args.no_pages)
+    for name, stats in results["benchmarks"].items():
+        print(f"{name:24} median {stats['median_ms']:9.2f} ms   p95 {stats['p95_ms']:9.2f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}.")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (commit {baseline.get('commit')}):")
+        regressions = 0
+        for name, before, after, ratio in compare_results(baseline, results):
+            flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+            regressions += bool(flag)
+            print(f"{name:24} {before:9.2f} -> {after:9.2f} ms  x{ratio:.2f}{flag}")
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import zlib
+
+#--- Compression Configuration ---
+COMPRESS_TEXT = True        # store long entries and AI responses compressed
+COMPRESS_MIN_LENGTH = 256   # characters below which text is stored as-is
+COMPRESSION_LEVEL = 6
+
+#Compressed values are BLOBs starting with a one-byte format tag; plain TEXT
+#values are left untouched, so compressed and uncompressed rows can coexist.
+#A tag's meaning must never change once rows have been written with it: a new
+#dictionary gets a new tag.
+TAG_ZLIB = 1
+TAG_ZLIB_DICT_V1 = 2
+#Preset dictionary of phrases common in journal entries and AI insights. zlib
+#can refer back into it from the very first byte, which is where short texts
+#lose most of their compression.
+DICTIONARY_V1 = (
+    " and the of to a in that it was for on with but so I my me I'm I've I was I am I feel I felt I think "
+    "today yesterday tomorrow this morning this afternoon this evening tonight last night the day the week "
+    "work friend friends family mom dad sister brother partner home school meeting deadline project "
+    "happy sad anxious tired excited grateful stressed calm lonely overwhelmed hopeful proud worried "
+    "really just feel felt feeling think thought want wanted need needed going to trying to "
+    "A Poem: A Motivational Quote: A Short Story: A One-Act Play: your journey you are you have "
+    "Remember that every day is a new chapter, and the best is yet to come. Keep going. "
+).encode()
+DICTIONARIES = {TAG_ZLIB_DICT_V1: DICTIONARY_V1}
+CURRENT_TAG = TAG_ZLIB_DICT_V1
+
+#--- Compression Functions ---
+def _compressor(tag):
+    """Returns a fresh zlib compressor for a format tag."""
+    if tag in DICTIONARIES:
+        return zlib.compressobj(COMPRESSION_LEVEL, zdict=DICTIONARIES[tag])
+    return zlib.compressobj(COMPRESSION_LEVEL)
+
+def _decompressor(tag):
+    """Returns a fresh zlib decompressor for a format tag."""
+    if tag in DICTIONARIES:
+        return zlib.decompressobj(zdict=DICTIONARIES[tag])
+    if tag == TAG_ZLIB:
+        return zlib.decompressobj()
+    raise ValueError(f"Unknown compression format tag {tag}")
+
+def compress_text(text, min_length=None):
+    """Returns the value to store for text: a tagged BLOB when compressing pays off, otherwise the text itself.
+
+    Text shorter than min_length (COMPRESS_MIN_LENGTH by default) is stored as-is.
+    """
+    min_length = COMPRESS_MIN_LENGTH if min_length is None else min_length
+    if not COMPRESS_TEXT or text is None or len(text) < min_length:
+        return text
+    compressor = _compressor(CURRENT_TAG)
+    blob = bytes([CURRENT_TAG]) + compressor.compress(text.encode()) + compressor.flush()
+    return blob if len(blob) < len(text.encode()) else text
+
+def decompress_text(value):
+    """Returns the text behind a stored value; plain text and None pass through."""
+    if not isinstance(value, bytes):
+        return value
+    decompressor = _decompressor(value[0])
+    return (decompressor.decompress(value[1:]) + decompressor.flush()).decode()
+
+def text_prefix(value, length):
+    """Returns the first length characters behind a stored value, inflating no more of it than needed."""
+    if not isinstance(value, bytes):
+        return value[:length] if value is not None else None
+    #a character is at most 4 bytes of UTF-8
+    head = _decompressor(value[0]).decompress(value[1:], length * 4)
+    return head.decode(errors="ignore")[:length]
+
+def text_length(value):
+    """Returns the length in characters of the text behind a stored value."""
+    text = decompress_text(value)
+    return len(text) if text is not None else None
+
+def register_functions(conn):
+    """Makes decompress(), text_prefix() and text_length() available to SQL on a connection."""
+    conn.create_function("decompress", 1, decompress_text, deterministic=True)
+    conn.create_function("text_prefix", 2, text_prefix, deterministic=True)
+    conn.create_function("text_length", 1, text_length, deterministic=True)
@@ -0,0 +1,1658 @@
+import sqlite3
+import hashlib
+import datetime
+import contextlib
+import itertools
+import os
+import queue
+import threading
+import time
+from query_cache import cached_per_user, invalidate_user, set_generation_source
+from metrics import instrumented, record_lock_wait
+from compression import compress_text, decompress_text, register_functions
+from related import index_entry, unindex_entry, drop_index
+
+#--- DataBase Configuration ---
+DB_PATH = "journal.db"
+POOL_SIZE = 8               # idle connections kept open per database file
+BUSY_TIMEOUT = 5.0          # seconds a connection waits on a locked database
+CACHED_STATEMENTS = 256     # prepared statements reused per connection
+ENTRY_PAGE_SIZE = 10        # entry headers shown per dashboard page
+SEARCH_RESULT_LIMIT = 20    # best-ranked matches returned by a search
+SNIPPET_LENGTH = 80         # characters of content kept in an entry header
+IMPORT_BATCH_SIZE = 1000    # entries inserted per transaction by a bulk import
+SHARD_COUNT = 0             # 0 keeps every journal in DB_PATH; N spreads new users over N shard files
+SHARD_ID_BITS = 40          # entry and AI job IDs carry their shard number above these bits
+ARCHIVE_BATCH_SIZE = 500    # entries moved to the archive per transaction
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",     # safe with WAL, avoids an fsync per commit
+    "journal_size_limit": 67108864,  # truncate the WAL back to 64 MB after a checkpoint
+    "cache_size": -16000,        # ~16 MB page cache per connection
+    "mmap_size": 268435456,      # map up to 256 MB of the file
+    "temp_store": "MEMORY",
+}
+
+#--- Connection Pool ---
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _open_connection(path):
+    """Opens a new connection to the database and applies the tuning pragmas."""
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    #only takes effect on a new file, and only before WAL is switched on; existing
+    #files are converted by a one-off VACUUM (python maintenance.py vacuum)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    #WAL lets sessions keep reading while another session writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    #entry text may be stored compressed; views, triggers and queries decode it with these
+    register_functions(conn)
+    return conn
+
+def _get_pool(path):
+    """Returns the idle-connection pool for a database file, creating it if needed."""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = queue.LifoQueue(maxsize=POOL_SIZE)
+            _pools[path] = pool
+        return pool
+
+@contextlib.contextmanager
+def get_connection(path=None):
+    """Borrows a long-lived connection from the pool, committing on success and rolling back on error.
+
+    Connects to DB_PATH unless another database file (e.g. a shard) is given.
+    """
+    path = path or DB_PATH
+    pool = _get_pool(path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(path)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def _begin_write(conn):
+    """Starts a write transaction (BEGIN IMMEDIATE), recording how long it waited for the write lock."""
+    started = time.perf_counter()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError:
+        #"database is locked": another writer held the lock for the whole BUSY_TIMEOUT
+        record_lock_wait(time.perf_counter() - started, timed_out=True)
+        raise
+    record_lock_wait(time.perf_counter() - started)
+
+def close_all_connections():
+    """Closes every pooled connection (used when the database file is replaced)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    with _user_shards_lock:
+        _user_shards.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+#--- Sharded Storage ---
+#With SHARD_COUNT > 0 a user's journal (entries, streaks, rollups, AI jobs)
+#lives in one of journal-shard-1.db .. journal-shard-N.db, so users on
+#different shards never queue on the same write lock. DB_PATH stays the
+#directory: users, logins, the user_shards map and the AI response cache. It is
+#also "shard 0", home to every user without a user_shards row, which is how a
+#single-file database keeps working until it is rebalanced.
+_user_shards = {}
+_user_shards_lock = threading.Lock()
+_claim_rotation = itertools.count()
+
+def configure_database(path=None, shard_count=None):
+    """Selects the database file and the number of shards."""
+    global DB_PATH, SHARD_COUNT
+    if path is not None:
+        DB_PATH = path
+    if shard_count is not None:
+        SHARD_COUNT = int(shard_count)
+
+def shard_path(shard):
+    """Returns the database file of a shard; shard 0 is DB_PATH itself."""
+    if shard == 0:
+        return DB_PATH
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}-shard-{shard}{ext or '.db'}"
+
+def shard_of_id(row_id):
+    """Returns the shard an entry or AI job ID was allocated in."""
+    return row_id >> SHARD_ID_BITS
+
+def target_shard(user_id, shard_count=None):
+    """Returns the shard a user belongs on for a shard count (0 = the single file)."""
+    shard_count = SHARD_COUNT if shard_count is None else shard_count
+    return user_id % shard_count + 1 if shard_count else 0
+
+def user_shard(user_id):
+    """Returns the shard holding a user's journal."""
+    key = (DB_PATH, user_id)
+    with _user_shards_lock:
+        shard = _user_shards.get(key)
+    if shard is None:
+        with get_connection() as conn:
+            row = conn.execute("SELECT shard FROM user_shards WHERE user_id=?", (user_id,)).fetchone()
+        shard = row[0] if row else 0
+        with _user_shards_lock:
+            _user_shards[key] = shard
+    return shard
+
+def user_connection(user_id):
+    """Borrows a pooled connection to the database holding a user's journal."""
+    return get_connection(shard_path(user_shard(user_id)))
+
+def id_connection(row_id):
+    """Borrows a pooled connection to the database holding an entry or AI job."""
+    return get_connection(shard_path(shard_of_id(row_id)))
+
+def all_shards():
+    """Returns every shard that may hold journals, shard 0 included."""
+    with get_connection() as conn:
+        highest = conn.execute("SELECT COALESCE(MAX(shard), 0) FROM user_shards").fetchone()[0]
+    return list(range(max(SHARD_COUNT, highest) + 1))
+
+def _next_id(conn, table, shard):
+    """Returns the ID for a new row in a shard's table, or None to let SQLite pick one on shard 0."""
+    #archived entries keep their IDs, so new entries must be numbered past them too
+    archived_id = conn.execute("SELECT MAX(id) FROM entries_archive").fetchone()[0] if table == "entries" else None
+    if shard == 0 and archived_id is None:
+        return None
+    last_id = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+    return max((last_id or 0) + 1, (archived_id or 0) + 1, shard << SHARD_ID_BITS)
+
+#--- Query Cache Generations ---
+def _bump_generation(conn, user_id):
+    """Invalidates a user's cached results in every process; run it inside the write transaction that changes them."""
+    #random rather than counted, so a journal moved to a fresh shard can never repeat a generation that is still cached
+    conn.execute("INSERT OR REPLACE INTO query_generations (user_id, generation) VALUES (?, random())", (user_id,))
+
+def _bump_all_generations(conn):
+    """Invalidates the cached results of every user in one database; run it inside the rebuild's write transaction."""
+    conn.execute(
+        "INSERT OR REPLACE INTO query_generations (user_id, generation) SELECT user_id, random() FROM (SELECT user_id FROM journal_entries UNION SELECT user_id FROM query_generations)"
+    )
+
+@instrumented("db")
+def get_user_generation(user_id):
+    """Returns the generation of a user's cached results shared by every process (0 before their first write)."""
+    with user_connection(user_id) as conn:
+        row = conn.execute("SELECT generation FROM query_generations WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+set_generation_source(get_user_generation)
+
+#--- Schema Migrations ---
+#Each migration is (version, description, steps). A step is either an SQL
+#statement or a callable taking the connection; steps must be idempotent so a
+#half-applied migration from an older build can safely be re-run.
+MIGRATIONS = [
+    (1, "base tables", [
+        #create users tablefor login and security
+        """
+        CREATE TABLE IF NOT EXISTS users (
+             id INTEGER PRIMARY KEY,
+             username TEXT UNIQUE NOT NULL,
+             password TEXT NOT NULL,
+             passcode TEXT
+        );
+        """,
+        #create journal entries table
+        """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            content TEXT NOT NULL,
+            mood TEXT,
+            ai_response TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        """,
+        #create streaks table to track streaks
+        """
+        CREATE TABLE IF NOT EXISTS streaks (
+            user_id INTEGER PRIMARY KEY,
+            streak_count INTEGER DEFAULT 0,
+            last_entry_date TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        """,
+    ]),
+    (2, "per-user entry indexes", [
+        #covers get_entry_dates and the date ordering of get_all_entries
+        "CREATE INDEX IF NOT EXISTS idx_entries_user_date ON entries(user_id, date)",
+        #covers get_total_entries and the latest-entry lookup
+        "CREATE INDEX IF NOT EXISTS idx_entries_user_id ON entries(user_id, id)",
+    ]),
+    (3, "background AI job queue", [
+        #run_after doubles as the lease expiry while a job is running, so jobs
+        #held by a crashed process become claimable again on their own
+        """
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id INTEGER PRIMARY KEY,
+            entry_id INTEGER UNIQUE NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (entry_id) REFERENCES entries(id)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ai_jobs_status ON ai_jobs(status, run_after)",
+    ]),
+    (4, "streamed AI response progress", [
+        lambda conn: _add_column(conn, "ai_jobs", "partial_response", "TEXT"),
+    ]),
+    (5, "AI response cache", [
+        """
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            cache_key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        ) WITHOUT ROWID;
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_cache(last_used)",
+    ]),
+    (6, "daily activity and longest streaks", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_activity (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            entry_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, date)
+        ) WITHOUT ROWID;
+        """,
+        lambda conn: _add_column(conn, "streaks", "longest_streak", "INTEGER DEFAULT 0"),
+        #the entry archive (migration 12) does not exist yet
+        lambda conn: _backfill_daily_activity(conn, source="entries"),
+    ]),
+    (7, "full-text search index", [
+        #the index reads entry text through this view, so the text is stored once;
+        #user_tag lets a search be scoped to one user inside the index itself
+        """
+        CREATE VIEW IF NOT EXISTS entries_fts_source AS
+            SELECT id, 'u' || user_id AS user_tag, content, ai_response FROM entries;
+        """,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            user_tag, content, ai_response,
+            content='entries_fts_source', content_rowid='id',
+            tokenize='porter unicode61'
+        );
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, user_tag, content, ai_response)
+                VALUES (new.id, 'u' || new.user_id, new.content, new.ai_response);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, user_tag, content, ai_response)
+                VALUES ('delete', old.id, 'u' || old.user_id, old.content, old.ai_response);
+        END;
+        """,
+        #the AI response is filled in after the insert by the background workers
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE OF content, ai_response ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, user_tag, content, ai_response)
+                VALUES ('delete', old.id, 'u' || old.user_id, old.content, old.ai_response);
+            INSERT INTO entries_fts (rowid, user_tag, content, ai_response)
+                VALUES (new.id, 'u' || new.user_id, new.content, new.ai_response);
+        END;
+        """,
+        #backfill existing databases
+        "INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')",
+    ]),
+    (8, "mood and activity rollups", [
+        #period is 'week' (period_start = the Monday) or 'month' (the 1st)
+        """
+        CREATE TABLE IF NOT EXISTS mood_rollup (
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            mood TEXT NOT NULL,
+            entry_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, period, period_start, mood)
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS weekday_rollup (
+            user_id INTEGER NOT NULL,
+            weekday INTEGER NOT NULL,
+            entry_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, weekday)
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_totals (
+            user_id INTEGER PRIMARY KEY,
+            entry_count INTEGER NOT NULL,
+            total_chars INTEGER NOT NULL
+        );
+        """,
+        lambda conn: rebuild_rollups(conn, source="entries"),
+    ]),
+    (9, "compressed entry text", [
+        #the search index keeps indexing plain text: the view and the triggers
+        #decode compressed values. Triggers are dropped first so compressing
+        #the existing rows does not churn the index.
+        "DROP TRIGGER IF EXISTS entries_fts_insert",
+        "DROP TRIGGER IF EXISTS entries_fts_delete",
+        "DROP TRIGGER IF EXISTS entries_fts_update",
+        "DROP VIEW IF EXISTS entries_fts_source",
+        lambda conn: recompress_entries(conn),
+        """
+        CREATE VIEW entries_fts_source AS
+            SELECT id, 'u' || user_id AS user_tag, decompress(content) AS content, decompress(ai_response) AS ai_response FROM entries;
+        """,
+        """
+        CREATE TRIGGER entries_fts_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, user_tag, content, ai_response)
+                VALUES (new.id, 'u' || new.user_id, decompress(new.content), decompress(new.ai_response));
+        END;
+        """,
+        """
+        CREATE TRIGGER entries_fts_delete AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, user_tag, content, ai_response)
+                VALUES ('delete', old.id, 'u' || old.user_id, decompress(old.content), decompress(old.ai_response));
+        END;
+        """,
+        """
+        CREATE TRIGGER entries_fts_update AFTER UPDATE OF content, ai_response ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, user_tag, content, ai_response)
+                VALUES ('delete', old.id, 'u' || old.user_id, decompress(old.content), decompress(old.ai_response));
+            INSERT INTO entries_fts (rowid, user_tag, content, ai_response)
+                VALUES (new.id, 'u' || new.user_id, decompress(new.content), decompress(new.ai_response));
+        END;
+        """,
+    ]),
+    (10, "sharded storage directory", [
+        #only read in DB_PATH; a user without a row lives in DB_PATH itself
+        """
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard INTEGER NOT NULL
+        );
+        """,
+    ]),
+    (11, "shared LLM admission control", [
+        #only used in DB_PATH, which every server process shares
+        """
+        CREATE TABLE IF NOT EXISTS llm_queue (
+            ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+            expires_at REAL NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS llm_slots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            expires_at REAL NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS llm_bucket (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            call_key TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL,
+            result TEXT
+        ) WITHOUT ROWID;
+        """,
+    ]),
+    (12, "entry archive and maintenance schedule", [
+        #old entries moved out of entries (and so out of the search index) keep
+        #their IDs; every other read goes through journal_entries, which merges
+        #both tables along their (user_id, date) indexes
+        """
+        CREATE TABLE IF NOT EXISTS entries_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            content TEXT NOT NULL,
+            mood TEXT,
+            ai_response TEXT
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_entries_archive_user_date ON entries_archive(user_id, date)",
+        """
+        CREATE VIEW IF NOT EXISTS journal_entries AS
+            SELECT id, user_id, date, content, mood, ai_response FROM entries
+            UNION ALL
+            SELECT id, user_id, date, content, mood, ai_response FROM entries_archive;
+        """,
+        #only used in DB_PATH, so every server process shares one schedule
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            task TEXT PRIMARY KEY,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            result TEXT
+        );
+        """,
+    ]),
+    (13, "search index without SQL functions", [
+        #the view and triggers of migration 9 called decompress(), which only
+        #exists on the app's connections, so any other tool failed to write
+        #entries. The index now keeps its own plain-text copy and is kept in
+        #step from Python (see _index_entries).
+        "DROP TRIGGER IF EXISTS entries_fts_insert",
+        "DROP TRIGGER IF EXISTS entries_fts_delete",
+        "DROP TRIGGER IF EXISTS entries_fts_update",
+        "DROP TABLE IF EXISTS entries_fts",
+        "DROP VIEW IF EXISTS entries_fts_source",
+        """
+        CREATE VIRTUAL TABLE entries_fts USING fts5(
+            user_tag, content, ai_response,
+            tokenize='porter unicode61'
+        );
+        """,
+        lambda conn: rebuild_search_index(conn),
+    ]),
+    (14, "shared query cache generations", [
+        #in each user's own file, bumped in the transactions that change what
+        #the cached reads return, so every process sees every other's writes
+        """
+        CREATE TABLE IF NOT EXISTS query_generations (
+            user_id INTEGER PRIMARY KEY,
+            generation INTEGER NOT NULL
+        );
+        """,
+    ]),
+    (15, "LLM admission state moved to its own file", [
+        #now in admission_path() (see ADMISSION_TABLES); the rows only ever
+        #described calls in flight, so nothing needs copying
+        "DROP TABLE IF EXISTS llm_queue",
+        "DROP TABLE IF EXISTS llm_slots",
+        "DROP TABLE IF EXISTS llm_bucket",
+        "DROP TABLE IF EXISTS llm_calls",
+    ]),
+]
+
+def _add_column(conn, table, column, declaration):
+    """Adds a column to a table unless it is already there (ALTER TABLE has no IF NOT EXISTS)."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+def get_schema_version(conn):
+    """Returns the highest migration version applied to the database."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        );
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def run_migrations(conn):
+    """Applies every pending migration in order, each in its own transaction. Returns the versions applied."""
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        #take the write lock first so two processes never apply the same step
+        _begin_write(conn)
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.datetime.now().isoformat(timespec="seconds")),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    if applied:
+        analyze_tables(conn)
+    return applied
+
+def analyze_tables(conn):
+    """Refreshes planner statistics so the query planner picks up new indexes.
+
+    FTS5 shadow tables are skipped: statistics gathered while the index is
+    small make SQLite plan FTS5's internal lookups as full scans later on.
+    """
+    for name, table_type in conn.execute("SELECT name, type FROM pragma_table_list WHERE schema='main'").fetchall():
+        if table_type == "table" and not name.startswith("sqlite_"):
+            conn.execute(f'ANALYZE "{name}"')
+    _drop_shadow_stats(conn)
+    conn.commit()
+
+def _drop_shadow_stats(conn):
+    """Removes any planner statistics gathered for FTS5 shadow tables (see analyze_tables)."""
+    tables = conn.execute("SELECT name, type FROM pragma_table_list WHERE schema='main'").fetchall()
+    shadow_tables = [name for name, table_type in tables if table_type == "shadow"]
+    if shadow_tables and any(name == "sqlite_stat1" for name, _ in tables):
+        conn.executemany("DELETE FROM sqlite_stat1 WHERE tbl=?", [(name,) for name in shadow_tables])
+        #reload the statistics into the planner
+        conn.execute("ANALYZE sqlite_schema")
+
+def recompress_entries(conn, batch_size=500, table="entries"):
+    """Rewrites stored entry text under the current compression settings. Returns the number of rows changed.
+
+    Compresses plain rows, moves old formats to the current one, and with
+    COMPRESS_TEXT off turns everything back into plain text. Archived entries
+    (table="entries_archive") are compressed however short they are.
+    """
+    min_length = 0 if table == "entries_archive" else None
+    changed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(f"SELECT id, content, ai_response FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)).fetchall()
+        if not rows:
+            return changed
+        last_id = rows[-1][0]
+        updates = []
+        for entry_id, content, ai_response in rows:
+            new_content = compress_text(decompress_text(content), min_length)
+            new_ai_response = compress_text(decompress_text(ai_response), min_length)
+            if new_content != content or new_ai_response != ai_response:
+                updates.append((new_content, new_ai_response, entry_id))
+        conn.executemany(f"UPDATE {table} SET content=?, ai_response=? WHERE id=?", updates)
+        changed += len(updates)
+
+def _backfill_daily_activity(conn, user_id=None, source="journal_entries"):
+    """Rebuilds daily_activity from entries (archived ones included) and recomputes streaks from it, for every user or just one."""
+    scope, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    conn.execute(f"DELETE FROM daily_activity {scope}", params)
+    conn.execute(f"INSERT INTO daily_activity (user_id, date, entry_count) SELECT user_id, date, COUNT(*) FROM {source} {scope} GROUP BY user_id, date", params)
+    user_ids = [user_id] if user_id is not None else [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM daily_activity").fetchall()]
+    for streak_user_id in user_ids:
+        recompute_streak(conn, streak_user_id)
+
+#--- DataBase Functions ---
+def init_db():
+    """Initializes the SQLite database (and any shards) and brings their schema up to date."""
+    with get_connection() as conn:
+        run_migrations(conn)
+    for shard in all_shards()[1:]:
+        with get_connection(shard_path(shard)) as conn:
+            run_migrations(conn)
+    with get_connection(admission_path()) as conn:
+        for statement in ADMISSION_TABLES:
+            conn.execute(statement)
+
+def hash_password(password):
+    """Hashes a password using SHA-256 for secure storage."""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+@instrumented("db")
+def register_user(username, password):
+    """Registers a new user and returns their user ID."""
+    try:
+        with get_connection() as conn:
+            hashed_password = hash_password(password)
+            cursor = conn.execute("INSERT INTO users (username, password) Values (?, ?)", (username, hashed_password))
+            user_id = cursor.lastrowid
+            if SHARD_COUNT:
+                conn.execute("INSERT INTO user_shards (user_id, shard) VALUES (?, ?)", (user_id, target_shard(user_id)))
+    except sqlite3.IntegrityError:
+        return None, "An account with this username already exists."
+    invalidate_user(user_id)
+    return user_id, None
+
+@instrumented("db")
+def login_user(username, password):
+    """Logs in a user and returns their user ID if credentials are correct."""
+    hashed_password = hash_password(password)
+    with get_connection() as conn:
+        user = conn.execute("SELECT id FROM users WHERE username=? AND password=?", (username, hashed_password)).fetchone()
+    return user[0] if user else None
+
+@instrumented("db")
+def get_user_id(username):
+    """Looks up a user ID by username. Returns None if there is no such user."""
+    with get_connection() as conn:
+        user = conn.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()
+    return user[0] if user else None
+
+@cached_per_user
+@instrumented("db")
+def get_username(user_id):
+    """Fetches the username for a given user ID."""
+    with get_connection() as conn:
+        username = conn.execute("SELECT username FROM users WHERE id=?", (user_id,)).fetchone()
+    return username[0] if username else None
+
+@instrumented("db")
+def set_security_key(user_id, passcode):
+    """Sets a security passcode for a user."""
+    with get_connection() as conn:
+        conn.execute("UPDATE users SET passcode = ? WHERE id = ?", (passcode, user_id))
+    #bumped once the new passcode is committed, so no process caches the old one under the new generation
+    with user_connection(user_id) as conn:
+        _bump_generation(conn, user_id)
+    invalidate_user(user_id)
+
+@cached_per_user
+@instrumented("db")
+def get_user_passcode(user_id):
+    """Retrieves the security passcode for a user."""
+    with get_connection() as conn:
+        passcode = conn.execute("SELECT passcode FROM users WHERE id = ?", (user_id,)).fetchone()
+    return passcode[0] if passcode else None
+
+@cached_per_user
+@instrumented("db")
+def get_last_entry_and_ai_response(user_id):
+    """Fetches the last journal entry and its AI response for a given user."""
+    with user_connection(user_id) as conn:
+        entry = conn.execute("SELECT content, ai_response FROM journal_entries WHERE user_id=? ORDER BY id  DESC LIMIT 1", (user_id, )).fetchone()
+    return (decompress_text(entry[0]), decompress_text(entry[1])) if entry else None
+
+@instrumented("db")
+def save_entry(user_id, content, mood, ai_response=None, entry_date=None):
+    """saves a new journal entry amd the AI response for the current user.
+
+    The entry, its daily activity and the user's streak are written in one
+    transaction. When no AI response is given a pending job is queued for the
+    background workers to fill it in. Returns the entry ID.
+    """
+    date_str = (entry_date or datetime.date.today()).isoformat()
+    shard = user_shard(user_id)
+    with get_connection(shard_path(shard)) as conn:
+        _begin_write(conn)
+        cursor = conn.execute(
+            "INSERT INTO entries (id, user_id, date, content, mood, ai_response) VALUES (?, ?, ?, ?, ?, ?)",
+            (_next_id(conn, "entries", shard), user_id, date_str, compress_text(content), mood, compress_text(ai_response)),
+        )
+        entry_id = cursor.lastrowid
+        _index_entries(conn, [(entry_id, user_id, content, ai_response)])
+        if ai_response is None:
+            conn.execute(
+                "INSERT INTO ai_jobs (id, entry_id, created_at) VALUES (?, ?, ?)",
+                (_next_id(conn, "ai_jobs", shard), entry_id, datetime.datetime.now().isoformat(timespec="seconds")),
+            )
+        _add_activity(conn, user_id, date_str)
+        _apply_rollups(conn, user_id, date_str, mood, len(content), 1)
+        _bump_generation(conn, user_id)
+    invalidate_user(user_id)
+    index_entry(user_id, entry_id, content)
+    return entry_id
+
+@instrumented("db")
+def delete_entry(entry_id):
+    """Deletes a journal entry by its ID, keeping the owner's streak in step."""
+    with id_connection(entry_id) as conn:
+        _begin_write(conn)
+        entry = conn.execute("SELECT user_id, date, mood, text_length(content) FROM journal_entries WHERE id =?", (entry_id,)).fetchone()
+        if entry is None:
+            return
+        user_id, date_str, mood, length = entry
+        conn.execute("DELETE FROM ai_jobs WHERE entry_id =?", (entry_id,))
+        conn.execute("DELETE FROM entries WHERE id =?", (entry_id,))
+        conn.execute("DELETE FROM entries_archive WHERE id =?", (entry_id,))
+        conn.execute("DELETE FROM entries_fts WHERE rowid =?", (entry_id,))
+        _remove_activity(conn, user_id, date_str)
+        _apply_rollups(conn, user_id, date_str, mood, length, -1)
+        _bump_generation(conn, user_id)
+    invalidate_user(user_id)
+    unindex_entry(user_id, entry_id)
+
+#--- Streak Functions ---
+#Streaks are derived from daily_activity (one row per user per journaled day)
+#so they can be adjusted after inserts and deletes without reading entries.
+def _run_length(conn, user_id, date_str, step):
+    """Counts consecutive journaled days starting at `date_str`, walking backwards (step=-1) or forwards (step=1)."""
+    if step < 0:
+        rows = conn.execute("SELECT date FROM daily_activity WHERE user_id=? AND date<=? ORDER BY date DESC", (user_id, date_str))
+    else:
+        rows = conn.execute("SELECT date FROM daily_activity WHERE user_id=? AND date>=? ORDER BY date ASC", (user_id, date_str))
+    expected = datetime.date.fromisoformat(date_str)
+    count = 0
+    for (day,) in rows:
+        if day != expected.isoformat():
+            break
+        count += 1
+        expected += datetime.timedelta(days=step)
+    rows.close()
+    return count
+
+def _scan_runs(conn, user_id):
+    """Walks all journaled days once. Returns (current run, longest run, last journaled date)."""
+    longest = current = 0
+    previous = None
+    for (day,) in conn.execute("SELECT date FROM daily_activity WHERE user_id=? ORDER BY date", (user_id,)):
+        day = datetime.date.fromisoformat(day)
+        current = current + 1 if previous is not None and (day - previous).days == 1 else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest, previous.isoformat() if previous else None
+
+def _store_streak(conn, user_id, streak_count, longest_streak, last_entry_date):
+    """Writes a user's streak row."""
+    conn.execute(
+        "INSERT INTO streaks (user_id, streak_count, longest_streak, last_entry_date) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET streak_count=excluded.streak_count, longest_streak=excluded.longest_streak, last_entry_date=excluded.last_entry_date",
+        (user_id, streak_count, longest_streak, last_entry_date),
+    )
+
+def _add_activity(conn, user_id, date_str):
+    """Counts an entry on `date_str` and, if it is a newly journaled day, extends the streak."""
+    row = conn.execute("SELECT entry_count FROM daily_activity WHERE user_id=? AND date=?", (user_id, date_str)).fetchone()
+    if row is not None:
+        conn.execute("UPDATE daily_activity SET entry_count=entry_count+1 WHERE user_id=? AND date=?", (user_id, date_str))
+        return
+    conn.execute("INSERT INTO daily_activity (user_id, date, entry_count) VALUES (?, ?, 1)", (user_id, date_str))
+    streak = conn.execute("SELECT streak_count, longest_streak, last_entry_date FROM streaks WHERE user_id=?", (user_id,)).fetchone()
+    streak_count, longest_streak, last_entry_date = streak if streak else (0, 0, None)
+    longest_streak = longest_streak or 0
+    if last_entry_date is None or date_str > last_entry_date:
+        #the usual case: today's first entry
+        gap = (datetime.date.fromisoformat(date_str) - datetime.date.fromisoformat(last_entry_date)).days if last_entry_date else None
+        streak_count = streak_count + 1 if gap == 1 else 1
+        longest_streak = max(longest_streak, streak_count)
+        last_entry_date = date_str
+    else:
+        #a backdated day may bridge two runs, including the current one
+        streak_count = _run_length(conn, user_id, last_entry_date, -1)
+        bridged = _run_length(conn, user_id, date_str, -1) + _run_length(conn, user_id, date_str, 1) - 1
+        longest_streak = max(longest_streak, streak_count, bridged)
+    _store_streak(conn, user_id, streak_count, longest_streak, last_entry_date)
+
+def _remove_activity(conn, user_id, date_str):
+    """Uncounts an entry on `date_str` and, if the day is no longer journaled, shortens the affected streaks."""
+    row = conn.execute("SELECT entry_count FROM daily_activity WHERE user_id=? AND date=?", (user_id, date_str)).fetchone()
+    if row is None:
+        return
+    if row[0] > 1:
+        conn.execute("UPDATE daily_activity SET entry_count=entry_count-1 WHERE user_id=? AND date=?", (user_id, date_str))
+        return
+    broken_run = _run_length(conn, user_id, date_str, -1) + _run_length(conn, user_id, date_str, 1) - 1
+    conn.execute("DELETE FROM daily_activity WHERE user_id=? AND date=?", (user_id, date_str))
+    streak = conn.execute("SELECT streak_count, longest_streak, last_entry_date FROM streaks WHERE user_id=?", (user_id,)).fetchone()
+    if streak is None:
+        recompute_streak(conn, user_id)
+        return
+    streak_count, longest_streak, last_entry_date = streak
+    if date_str == last_entry_date:
+        last_entry_date = conn.execute("SELECT MAX(date) FROM daily_activity WHERE user_id=?", (user_id,)).fetchone()[0]
+        streak_count = _run_length(conn, user_id, last_entry_date, -1) if last_entry_date else 0
+    elif last_entry_date and (datetime.date.fromisoformat(last_entry_date) - datetime.date.fromisoformat(date_str)).days < streak_count:
+        #the removed day was inside the current run, which now starts after it
+        streak_count = (datetime.date.fromisoformat(last_entry_date) - datetime.date.fromisoformat(date_str)).days
+    if broken_run >= (longest_streak or 0):
+        longest_streak = _scan_runs(conn, user_id)[1]
+    _store_streak(conn, user_id, streak_count, longest_streak, last_entry_date)
+
+def recompute_streak(conn, user_id):
+    """Recomputes a user's current and longest streak from daily_activity."""
+    _store_streak(conn, user_id, *_scan_runs(conn, user_id))
+
+@cached_per_user
+@instrumented("db")
+def get_streak(user_id):
+    """Fetches the user's current streak count."""
+    with user_connection(user_id) as conn:
+        streak = conn.execute("SELECT streak_count FROM streaks WHERE user_id=?", (user_id,)).fetchone()
+    return streak[0] if streak else 0
+
+@cached_per_user
+@instrumented("db")
+def get_longest_streak(user_id):
+    """Fetches the user's longest streak ever."""
+    with user_connection(user_id) as conn:
+        streak = conn.execute("SELECT longest_streak FROM streaks WHERE user_id=?", (user_id,)).fetchone()
+    return (streak[0] or 0) if streak else 0
+
+@cached_per_user
+@instrumented("db")
+def get_total_entries(user_id):
+    """Fetches the total number of journal entries for a user."""
+    with user_connection(user_id) as conn:
+        total = conn.execute("SELECT entry_count FROM user_totals WHERE user_id=?", (user_id,)).fetchone()
+    return total[0] if total else 0
+
+@cached_per_user
+@instrumented("db")
+def get_last_entry_id(user_id):
+    """Fetches the highest entry ID of a user, archived entries included, or None if they have none."""
+    with user_connection(user_id) as conn:
+        return conn.execute(
+            "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM entries WHERE user_id=? UNION ALL SELECT MAX(id) FROM entries_archive WHERE user_id=?)",
+            (user_id, user_id),
+        ).fetchone()[0]
+
+@cached_per_user
+@instrumented("db")
+def get_all_entries(user_id):
+    """Fetches all journal entries for a user, archived ones included, ordered by date."""
+    with user_connection(user_id) as conn:
+        rows = conn.execute("SELECT id, date, content, mood, ai_response FROM journal_entries WHERE user_id=? ORDER BY date DESC", (user_id,)).fetchall()
+    return [(entry_id, date_str, decompress_text(content), mood, decompress_text(ai_response)) for entry_id, date_str, content, mood, ai_response in rows]
+
+@cached_per_user
+@instrumented("db")
+def get_entries_between(user_id, start_date, end_date):
+    """Fetches (date, mood, content) of a user's entries from start_date to end_date inclusive (ISO dates), oldest first."""
+    with user_connection(user_id) as conn:
+        rows = conn.execute(
+            "SELECT date, mood, content FROM journal_entries WHERE user_id=? AND date BETWEEN ? AND ? ORDER BY date, id",
+            (user_id, start_date, end_date),
+        ).fetchall()
+    return [(date_str, mood, decompress_text(content)) for date_str, mood, content in rows]
+
+@instrumented("db")
+def get_active_user_ids(since_date):
+    """Returns the IDs of users who journaled on or after since_date (ISO date), across every shard."""
+    user_ids = set()
+    for shard in all_shards():
+        with get_connection(shard_path(shard)) as conn:
+            user_ids.update(row[0] for row in conn.execute("SELECT DISTINCT user_id FROM daily_activity WHERE date>=?", (since_date,)))
+    return sorted(user_ids)
+
+@cached_per_user
+@instrumented("db")
+def get_entry_dates(user_id):
+    """Fetches the dates of all journal entries for a user."""
+    with user_connection(user_id) as conn:
+        return [row[0] for row in conn.execute("SELECT date FROM journal_entries WHERE user_id=? ORDER BY date ASC", (user_id,))]
+
+@cached_per_user
+@instrumented("db")
+def get_journaled_days(user_id, year, month):
+    """Returns the set of day numbers in a month on which the user wrote an entry."""
+    first_day = datetime.date(year, month, 1)
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    with user_connection(user_id) as conn:
+        return {
+            int(row[0][8:10]) for row in conn.execute(
+                "SELECT DISTINCT date FROM journal_entries WHERE user_id=? AND date >= ? AND date < ?",
+                (user_id, first_day.isoformat(), next_month.isoformat()),
+            )
+        }
+
+@cached_per_user
+@instrumented("db")
+def get_entry_headers(user_id, before=None, limit=ENTRY_PAGE_SIZE):
+    """Fetches one page of lightweight entry headers (id, date, mood, snippet), newest first.
+
+    `before` is the (date, id) of the last header on the previous page; only
+    entries strictly older than it are returned, so each page is a single
+    index range scan no matter how deep the user pages.
+    """
+    with user_connection(user_id) as conn:
+        if before is None:
+            return conn.execute(
+                "SELECT id, date, mood, text_prefix(content, ?) FROM journal_entries WHERE user_id=? ORDER BY date DESC, id DESC LIMIT ?",
+                (SNIPPET_LENGTH, user_id, limit),
+            ).fetchall()
+        before_date, before_id = before
+        return conn.execute(
+            "SELECT id, date, mood, text_prefix(content, ?) FROM journal_entries WHERE user_id=? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?",
+            (SNIPPET_LENGTH, user_id, before_date, before_id, limit),
+        ).fetchall()
+
+@cached_per_user
+@instrumented("db")
+def get_entry(user_id, entry_id):
+    """Fetches the full content and AI response of one of the user's entries."""
+    with user_connection(user_id) as conn:
+        entry = conn.execute("SELECT content, ai_response FROM journal_entries WHERE id=? AND user_id=?", (entry_id, user_id)).fetchone()
+    return (decompress_text(entry[0]), decompress_text(entry[1])) if entry else None
+
+@cached_per_user
+@instrumented("db")
+def get_entry_summaries(user_id, entry_ids):
+    """Fetches (id, date, mood, snippet) headers for a tuple of the user's entry IDs, in the order given."""
+    if not entry_ids:
+        return []
+    placeholders = ", ".join("?" * len(entry_ids))
+    with user_connection(user_id) as conn:
+        rows = conn.execute(
+            f"SELECT id, date, mood, text_prefix(content, ?) FROM journal_entries WHERE user_id=? AND id IN ({placeholders})",
+            (SNIPPET_LENGTH, user_id, *entry_ids),
+        ).fetchall()
+    by_id = {row[0]: row for row in rows}
+    return [by_id[entry_id] for entry_id in entry_ids if entry_id in by_id]
+
+#--- Mood & Activity Rollups ---
+#Dashboard analytics read only these tables; save_entry and delete_entry keep
+#them current inside their own transactions.
+def _period_starts(date_str):
+    """Returns the (week, month) period starts for an entry date."""
+    day = datetime.date.fromisoformat(date_str)
+    return (day - datetime.timedelta(days=day.weekday())).isoformat(), day.replace(day=1).isoformat()
+
+def _apply_rollups(conn, user_id, date_str, mood, length, delta):
+    """Adds (delta=1) or removes (delta=-1) one entry from the user's rollups."""
+    week_start, month_start = _period_starts(date_str)
+    mood = mood or "Unknown"
+    for period, period_start in (("week", week_start), ("month", month_start)):
+        conn.execute(
+            "INSERT INTO mood_rollup (user_id, period, period_start, mood, entry_count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id, period, period_start, mood) DO UPDATE SET entry_count = entry_count + excluded.entry_count",
+            (user_id, period, period_start, mood, delta),
+        )
+    conn.execute(
+        "INSERT INTO weekday_rollup (user_id, weekday, entry_count) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id, weekday) DO UPDATE SET entry_count = entry_count + excluded.entry_count",
+        (user_id, datetime.date.fromisoformat(date_str).weekday(), delta),
+    )
+    conn.execute(
+        "INSERT INTO user_totals (user_id, entry_count, total_chars) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET entry_count = entry_count + excluded.entry_count, total_chars = total_chars + excluded.total_chars",
+        (user_id, delta, delta * (length or 0)),
+    )
+    if delta < 0:
+        conn.execute("DELETE FROM mood_rollup WHERE user_id=? AND entry_count<=0", (user_id,))
+
+def rebuild_rollups(conn, user_id=None, source="journal_entries"):
+    """Recomputes the rollup tables from entries (archived ones included), for every user or just one."""
+    scope, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    for table in ("mood_rollup", "weekday_rollup", "user_totals"):
+        conn.execute(f"DELETE FROM {table} {scope}", params)
+    conn.execute(f"""
+        INSERT INTO mood_rollup (user_id, period, period_start, mood, entry_count)
+        SELECT user_id, 'week', date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days'), COALESCE(mood, 'Unknown'), COUNT(*)
+        FROM {source} {scope} GROUP BY 1, 2, 3, 4
+    """, params)
+    conn.execute(f"""
+        INSERT INTO mood_rollup (user_id, period, period_start, mood, entry_count)
+        SELECT user_id, 'month', strftime('%Y-%m-01', date), COALESCE(mood, 'Unknown'), COUNT(*)
+        FROM {source} {scope} GROUP BY 1, 2, 3, 4
+    """, params)
+    conn.execute(f"""
+        INSERT INTO weekday_rollup (user_id, weekday, entry_count)
+        SELECT user_id, (CAST(strftime('%w', date) AS INTEGER) + 6) % 7, COUNT(*)
+        FROM {source} {scope} GROUP BY 1, 2
+    """, params)
+    conn.execute(f"""
+        INSERT INTO user_totals (user_id, entry_count, total_chars)
+        SELECT user_id, COUNT(*), SUM(text_length(content)) FROM {source} {scope} GROUP BY 1
+    """, params)
+
+@cached_per_user
+@instrumented("db")
+def get_mood_trends(user_id, period, limit=8):
+    """Returns (period_start, mood, count) rows for the user's latest `limit` weeks or months, oldest first."""
+    with user_connection(user_id) as conn:
+        return conn.execute(
+            """
+            SELECT period_start, mood, entry_count FROM mood_rollup
+            WHERE user_id=? AND period=? AND period_start IN (
+                SELECT DISTINCT period_start FROM mood_rollup WHERE user_id=? AND period=? ORDER BY period_start DESC LIMIT ?
+            )
+            ORDER BY period_start, mood
+            """,
+            (user_id, period, user_id, period, limit),
+        ).fetchall()
+
+@cached_per_user
+@instrumented("db")
+def get_weekday_counts(user_id):
+    """Returns the user's entry count for each weekday, Monday first."""
+    counts = [0] * 7
+    with user_connection(user_id) as conn:
+        for weekday, entry_count in conn.execute("SELECT weekday, entry_count FROM weekday_rollup WHERE user_id=?", (user_id,)):
+            counts[weekday] = entry_count
+    return counts
+
+@cached_per_user
+@instrumented("db")
+def get_average_entry_length(user_id):
+    """Returns the user's average entry length in characters."""
+    with user_connection(user_id) as conn:
+        totals = conn.execute("SELECT entry_count, total_chars FROM user_totals WHERE user_id=?", (user_id,)).fetchone()
+    return totals[1] / totals[0] if totals and totals[0] else 0
+
+#--- Full-Text Search ---
+#entries_fts holds a plain-text copy of each live entry (archived ones are left
+#out). Every write path updates it in the same transaction as the entry.
+def _index_entries(conn, rows):
+    """Adds (entry_id, user_id, content, ai_response) rows of plain text to the search index."""
+    conn.executemany(
+        "INSERT INTO entries_fts (rowid, user_tag, content, ai_response) VALUES (?, ?, ?, ?)",
+        [(entry_id, f"u{user_id}", content, ai_response) for entry_id, user_id, content, ai_response in rows],
+    )
+
+def _index_stored_entries(conn, where, params, batch_size=500):
+    """Adds the entries matching a WHERE clause to the search index, decompressing them in batches."""
+    cursor = conn.execute(f"SELECT id, user_id, content, ai_response FROM entries WHERE {where}", params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        _index_entries(conn, [(entry_id, user_id, decompress_text(content), decompress_text(ai_response)) for entry_id, user_id, content, ai_response in rows])
+
+def rebuild_search_index(conn, user_id=None):
+    """Rebuilds the search index from entries, for every user or just one (e.g. after editing entries with another tool)."""
+    if user_id is None:
+        conn.execute("DELETE FROM entries_fts")
+        _index_stored_entries(conn, "1", ())
+    else:
+        conn.execute("DELETE FROM entries_fts WHERE rowid IN (SELECT id FROM entries WHERE user_id=?)", (user_id,))
+        _index_stored_entries(conn, "user_id=?", (user_id,))
+
+def _fts_query(user_id, text):
+    """Turns free text into an FTS5 query where every (stemmed) word must match, scoped to the user.
+
+    Words are quoted so user input can never be parsed as FTS5 syntax. Prefix
+    matching is left out on purpose: a short prefix expands to every indexed
+    term that starts with it and turns a millisecond search into seconds.
+    """
+    terms = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if not terms:
+        return None
+    return f"user_tag : u{int(user_id)} AND ({' '.join(terms)})"
+
+@cached_per_user
+@instrumented("db")
+def search_entries(user_id, text, limit=SEARCH_RESULT_LIMIT):
+    """Searches the user's entries and AI insights, best matches first.
+
+    Returns (id, date, mood, content snippet, AI insight snippet) rows, with
+    matched words wrapped in ** for markdown highlighting. Archived entries
+    are not in the index and so are never found.
+    """
+    query = _fts_query(user_id, text)
+    if query is None:
+        return []
+    with user_connection(user_id) as conn:
+        return conn.execute(
+            """
+            SELECT e.id, e.date, e.mood,
+                   snippet(entries_fts, 1, '**', '**', '…', 16),
+                   snippet(entries_fts, 2, '**', '**', '…', 16)
+            FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+            WHERE entries_fts MATCH ?
+            ORDER BY bm25(entries_fts, 0.0, 1.0, 0.5)
+            LIMIT ?
+            """,
+            (query, limit),
+        ).fetchall()
+
+#--- Export & Import ---
+def iter_user_entries(user_id):
+    """Yields (date, mood, content, ai_response) for each of a user's entries, oldest first.
+
+    Rows are stepped from the cursor one at a time rather than fetched all at
+    once, so memory stays flat however long the journal is.
+    """
+    with user_connection(user_id) as conn:
+        cursor = conn.execute("SELECT date, mood, content, ai_response FROM journal_entries WHERE user_id=? ORDER BY date, id", (user_id,))
+        for date_str, mood, content, ai_response in cursor:
+            yield date_str, mood, decompress_text(content), decompress_text(ai_response)
+
+def iter_user_entry_texts(user_id):
+    """Yields (entry_id, content) for each of a user's entries, for rebuilding derived indexes."""
+    with user_connection(user_id) as conn:
+        for entry_id, content in conn.execute("SELECT id, content FROM journal_entries WHERE user_id=? ORDER BY id", (user_id,)):
+            yield entry_id, decompress_text(content)
+
+@instrumented("db")
+def import_entries(user_id, rows, batch_size=IMPORT_BATCH_SIZE):
+    """Bulk-inserts (date, mood, content, ai_response) rows for a user. Returns the number imported.
+
+    The import is one transaction, so a bad row leaves the journal untouched.
+    Rows are read and inserted batch_size at a time with executemany, entries
+    without an AI response get a pending job, and daily activity, the streak
+    and the rollups are rebuilt once at the end instead of row by row.
+    """
+    imported = _import_rows(user_shard(user_id), user_id, rows, batch_size)
+    if imported:
+        invalidate_user(user_id)
+        drop_index(user_id)
+    return imported
+
+def _import_rows(shard, user_id, rows, batch_size=IMPORT_BATCH_SIZE):
+    """Writes a user's rows into a shard in one transaction (see import_entries). Returns the number written."""
+    created_at = datetime.datetime.now().isoformat(timespec="seconds")
+    rows = iter(rows)
+    imported = 0
+    with get_connection(shard_path(shard)) as conn:
+        _begin_write(conn)
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+        first_id = _next_id(conn, "entries", shard)
+        while True:
+            batch = [
+                (None if first_id is None else first_id + imported + i, user_id, date_str, compress_text(content), mood, compress_text(ai_response))
+                for i, (date_str, mood, content, ai_response) in enumerate(itertools.islice(rows, batch_size))
+            ]
+            if not batch:
+                break
+            conn.executemany("INSERT INTO entries (id, user_id, date, content, mood, ai_response) VALUES (?, ?, ?, ?, ?, ?)", batch)
+            imported += len(batch)
+        if imported:
+            #a NULL first job ID (shard 0) leaves the numbering to SQLite
+            conn.execute(
+                """
+                INSERT INTO ai_jobs (id, entry_id, created_at)
+                SELECT ? + ROW_NUMBER() OVER (ORDER BY id) - 1, id, ? FROM entries WHERE id > ? AND user_id=? AND ai_response IS NULL
+                """,
+                (_next_id(conn, "ai_jobs", shard), created_at, last_id, user_id),
+            )
+            _index_stored_entries(conn, "id > ? AND user_id=?", (last_id, user_id))
+            _backfill_daily_activity(conn, user_id)
+            rebuild_rollups(conn, user_id)
+            _bump_generation(conn, user_id)
+    return imported
+
+#--- Shard Rebalancing ---
+#Moves copy a journal with the bulk import path, so streaks and rollups are
+#rebuilt in the target. Run them while the app is stopped: a write landing on
+#the old shard mid-move would be lost, and other processes cache user_shards.
+def _delete_user_journal(conn, user_id):
+    """Removes every row of a user's journal from one database."""
+    conn.execute("DELETE FROM ai_jobs WHERE entry_id IN (SELECT id FROM entries WHERE user_id=?)", (user_id,))
+    conn.execute("DELETE FROM entries_fts WHERE rowid IN (SELECT id FROM entries WHERE user_id=?)", (user_id,))
+    for table in ("entries", "entries_archive", "streaks", "daily_activity", "mood_rollup", "weekday_rollup", "user_totals"):
+        conn.execute(f"DELETE FROM {table} WHERE user_id=?", (user_id,))
+    _bump_generation(conn, user_id)
+
+def move_user(user_id, shard):
+    """Moves a user's journal to another shard (0 = DB_PATH). Returns the number of entries moved.
+
+    Entries get new IDs in the target shard. An interrupted move can simply be
+    run again: the target is cleared first and the source is only cleared once
+    the directory points at the target.
+    """
+    source = user_shard(user_id)
+    if source == shard:
+        return 0
+    with get_connection(shard_path(shard)) as conn:
+        _begin_write(conn)
+        _delete_user_journal(conn, user_id)
+    moved = _import_rows(shard, user_id, iter_user_entries(user_id))
+    with get_connection() as conn:
+        if shard:
+            conn.execute("INSERT OR REPLACE INTO user_shards (user_id, shard) VALUES (?, ?)", (user_id, shard))
+        else:
+            conn.execute("DELETE FROM user_shards WHERE user_id=?", (user_id,))
+    with _user_shards_lock:
+        _user_shards[(DB_PATH, user_id)] = shard
+    with get_connection(shard_path(source)) as conn:
+        _begin_write(conn)
+        _delete_user_journal(conn, user_id)
+    invalidate_user(user_id)
+    #entry IDs changed with the move
+    drop_index(user_id)
+    return moved
+
+def rebalance_shards(shard_count):
+    """Moves every user onto the shard shard_count assigns them; 0 gathers everyone back into DB_PATH.
+
+    Also the migration from the single-file layout. Returns (users moved, entries moved).
+    """
+    configure_database(shard_count=shard_count)
+    init_db()
+    with get_connection() as conn:
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+    users_moved = entries_moved = 0
+    for user_id in user_ids:
+        if user_shard(user_id) != target_shard(user_id):
+            entries_moved += move_user(user_id, target_shard(user_id))
+            users_moved += 1
+    return users_moved, entries_moved
+
+#--- AI Job Queue ---
+@instrumented("db")
+def claim_ai_job(lease_seconds, max_attempts, fallback_response):
+    """Claims the oldest runnable AI job, leasing it for `lease_seconds`.
+
+    A job whose lease ran out after its last attempt (its worker died or
+    crashed every time) is not handed out again: its entry gets
+    fallback_response() and the job is marked failed.
+    Returns (job_id, entry_id, user_id, content, mood, attempts) or None when nothing is due.
+    """
+    shards = all_shards()
+    #start at a different shard each time so a busy shard cannot starve the rest
+    offset = next(_claim_rotation) % len(shards)
+    for shard in shards[offset:] + shards[:offset]:
+        job = _claim_ai_job_in(shard, lease_seconds, max_attempts, fallback_response)
+        if job is not None:
+            return job
+    return None
+
+def _claim_ai_job_in(shard, lease_seconds, max_attempts, fallback_response):
+    """Claims the oldest runnable AI job in one shard (see claim_ai_job)."""
+    now = time.time()
+    with get_connection(shard_path(shard)) as conn:
+        _begin_write(conn)
+        abandoned = conn.execute(
+            """
+            SELECT j.id, j.entry_id, e.user_id FROM ai_jobs j JOIN entries e ON e.id = j.entry_id
+            WHERE j.status IN ('pending', 'running') AND j.run_after <= ? AND j.attempts >= ?
+            """,
+            (now, max_attempts),
+        ).fetchall()
+        for job_id, entry_id, user_id in abandoned:
+            ai_response = fallback_response()
+            conn.execute("UPDATE entries SET ai_response=? WHERE id=?", (compress_text(ai_response), entry_id))
+            conn.execute("UPDATE entries_fts SET ai_response=? WHERE rowid=?", (ai_response, entry_id))
+            conn.execute(
+                "UPDATE ai_jobs SET status='failed', error=?, partial_response=NULL WHERE id=?",
+                (f"abandoned after {max_attempts} attempt(s)", job_id),
+            )
+            _bump_generation(conn, user_id)
+        job = conn.execute(
+            "SELECT id, entry_id, attempts FROM ai_jobs WHERE status IN ('pending', 'running') AND run_after <= ? AND attempts < ? ORDER BY id LIMIT 1",
+            (now, max_attempts),
+        ).fetchone()
+        if job is not None:
+            job_id, entry_id, attempts = job
+            conn.execute("UPDATE ai_jobs SET status='running', attempts=?, run_after=? WHERE id=?", (attempts + 1, now + lease_seconds, job_id))
+            entry = conn.execute("SELECT user_id, content, mood FROM entries WHERE id=?", (entry_id,)).fetchone()
+            if entry is None:
+                #the entry was deleted under us, drop the orphaned job
+                conn.execute("DELETE FROM ai_jobs WHERE id=?", (job_id,))
+                job = None
+            else:
+                job = job_id, entry_id, entry[0], decompress_text(entry[1]), entry[2], attempts + 1
+    for user_id in {row[2] for row in abandoned}:
+        invalidate_user(user_id)
+    return job
+
+@instrumented("db")
+def complete_ai_job(job_id, entry_id, ai_response, status="done", error=None):
+    """Stores a generated AI response on its entry and marks the job finished."""
+    with id_connection(entry_id) as conn:
+        _begin_write(conn)
+        conn.execute("UPDATE entries SET ai_response=? WHERE id=?", (compress_text(ai_response), entry_id))
+        conn.execute("UPDATE entries_fts SET ai_response=? WHERE rowid=?", (ai_response, entry_id))
+        conn.execute("UPDATE ai_jobs SET status=?, error=?, partial_response=NULL WHERE id=?", (status, error, job_id))
+        owner = conn.execute("SELECT user_id FROM entries WHERE id=?", (entry_id,)).fetchone()
+        if owner is not None:
+            _bump_generation(conn, owner[0])
+    if owner is not None:
+        invalidate_user(owner[0])
+
+@instrumented("db")
+def update_ai_job_progress(job_id, partial_response):
+    """Stores the text streamed so far for a running AI job so the UI can show it."""
+    with id_connection(job_id) as conn:
+        _begin_write(conn)
+        conn.execute("UPDATE ai_jobs SET partial_response=? WHERE id=?", (partial_response, job_id))
+
+@instrumented("db")
+def retry_ai_job(job_id, delay_seconds, error):
+    """Puts a failed AI job back in the queue to be retried after a delay."""
+    with id_connection(job_id) as conn:
+        conn.execute("UPDATE ai_jobs SET status='pending', run_after=?, error=?, partial_response=NULL WHERE id=?", (time.time() + delay_seconds, error, job_id))
+
+@instrumented("db")
+def get_ai_status(entry_id):
+    """Returns (job status, ai_response, partial_response) for an entry, or None if the entry no longer exists.
+
+    The status is None for entries that were saved with their AI response already filled in.
+    """
+    with id_connection(entry_id) as conn:
+        status = conn.execute(
+            "SELECT j.status, e.ai_response, j.partial_response FROM entries e LEFT JOIN ai_jobs j ON j.entry_id = e.id WHERE e.id=?",
+            (entry_id,),
+        ).fetchone()
+    return (status[0], decompress_text(status[1]), status[2]) if status else None
+
+#--- AI Response Cache ---
+@instrumented("db")
+def get_cached_ai_response(cache_key, oldest_allowed):
+    """Returns (response, created_at) for a cached AI response created after `oldest_allowed` (epoch seconds), or None."""
+    with get_connection() as conn:
+        row = conn.execute("SELECT response, created_at FROM ai_cache WHERE cache_key=? AND created_at>=?", (cache_key, oldest_allowed)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE ai_cache SET last_used=? WHERE cache_key=?", (time.time(), cache_key))
+    return row[0], row[1]
+
+@instrumented("db")
+def put_cached_ai_response(cache_key, response):
+    """Stores (or refreshes) a cached AI response."""
+    now = time.time()
+    with get_connection() as conn:
+        _begin_write(conn)
+        conn.execute("INSERT OR REPLACE INTO ai_cache (cache_key, response, created_at, last_used) VALUES (?, ?, ?, ?)", (cache_key, response, now, now))
+
+@instrumented("db")
+def evict_cached_ai_responses(oldest_allowed, max_rows):
+    """Drops expired cache rows, then the least recently used ones beyond `max_rows`. Returns rows removed."""
+    with get_connection() as conn:
+        removed = conn.execute("DELETE FROM ai_cache WHERE created_at<?", (oldest_allowed,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM ai_cache WHERE cache_key IN (SELECT cache_key FROM ai_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (max_rows,),
+        ).rowcount
+    return removed
+
+#--- LLM Admission Control ---
+#The state behind admission.py. Every process shares one small file next to
+#DB_PATH, so its write lock (BEGIN IMMEDIATE) is what makes each check-and-take
+#below atomic across them. It is kept out of DB_PATH because queued callers
+#poll it many times a second, and there they would hold up every save_entry.
+ADMISSION_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS llm_queue (
+        ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+        expires_at REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS llm_slots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        expires_at REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS llm_bucket (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        call_key TEXT PRIMARY KEY,
+        expires_at REAL NOT NULL,
+        result TEXT
+    ) WITHOUT ROWID;
+    """,
+]
+
+def admission_path():
+    """Returns the file holding the shared LLM admission state (e.g. journal-llm.db)."""
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}-llm{ext or '.db'}"
+
+def _admission_room(conn, ticket, max_concurrent, rate, burst, now):
+    """Returns (tokens, seconds to wait): the rate-limit tokens if a slot is free for a ticket, else (None, wait)."""
+    running = conn.execute("SELECT COUNT(*) FROM llm_slots WHERE expires_at>?", (now,)).fetchone()[0]
+    ahead = conn.execute("SELECT COUNT(*) FROM llm_queue WHERE ticket<? AND expires_at>?", (ticket, now)).fetchone()[0]
+    if running + ahead >= max_concurrent:
+        return None, 0.0
+    bucket = conn.execute("SELECT tokens, updated_at FROM llm_bucket WHERE id=1").fetchone()
+    tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+    if tokens < ahead + 1:
+        return None, (ahead + 1 - tokens) / rate
+    return tokens, 0.0
+
+@instrumented("db")
+def enqueue_llm_call(expires_at):
+    """Joins the queue for an LLM call slot, giving up at `expires_at` (epoch seconds). Returns the ticket."""
+    with get_connection(admission_path()) as conn:
+        return conn.execute("INSERT INTO llm_queue (expires_at) VALUES (?)", (expires_at,)).lastrowid
+
+@instrumented("db")
+def try_admit_llm_call(ticket, max_concurrent, rate, burst, lease_seconds):
+    """Turns a queue ticket into a running slot if a slot and a rate-limit token are free for it.
+
+    Tickets are served in order: a ticket is only admitted if there is room
+    for every ticket ahead of it as well. Returns (slot_id, 0) when admitted,
+    otherwise (None, seconds until trying again is worthwhile).
+    """
+    now = time.time()
+    with get_connection(admission_path()) as conn:
+        #polling callers only read until it looks like their turn
+        tokens, wait = _admission_room(conn, ticket, max_concurrent, rate, burst, now)
+        if tokens is None:
+            return None, wait
+        _begin_write(conn)
+        #callers that crashed or gave up without cleaning up
+        conn.execute("DELETE FROM llm_queue WHERE expires_at<=? AND ticket<>?", (now, ticket))
+        conn.execute("DELETE FROM llm_slots WHERE expires_at<=?", (now,))
+        #checked again under the lock: another process may have taken the room since
+        tokens, wait = _admission_room(conn, ticket, max_concurrent, rate, burst, now)
+        if tokens is None:
+            return None, wait
+        conn.execute("INSERT OR REPLACE INTO llm_bucket (id, tokens, updated_at) VALUES (1, ?, ?)", (tokens - 1, now))
+        conn.execute("DELETE FROM llm_queue WHERE ticket=?", (ticket,))
+        slot_id = conn.execute("INSERT INTO llm_slots (expires_at) VALUES (?)", (now + lease_seconds,)).lastrowid
+    return slot_id, 0.0
+
+@instrumented("db")
+def leave_llm_queue(ticket):
+    """Removes a queue ticket that was never admitted."""
+    with get_connection(admission_path()) as conn:
+        conn.execute("DELETE FROM llm_queue WHERE ticket=?", (ticket,))
+
+@instrumented("db")
+def release_llm_slot(slot_id):
+    """Frees a running LLM call slot."""
+    with get_connection(admission_path()) as conn:
+        conn.execute("DELETE FROM llm_slots WHERE id=?", (slot_id,))
+
+@instrumented("db")
+def join_llm_call(call_key, expires_at):
+    """Registers an LLM call unless an identical one is already running or just finished.
+
+    Returns (True, None) if the caller should make the call, (False, None) if
+    another caller is making it, or (False, result) once that caller's result is in.
+    """
+    now = time.time()
+    with get_connection(admission_path()) as conn:
+        #followers polling a running call only read
+        row = conn.execute("SELECT result, expires_at FROM llm_calls WHERE call_key=?", (call_key,)).fetchone()
+        if row is not None and row[1] > now:
+            return False, row[0]
+        _begin_write(conn)
+        conn.execute("DELETE FROM llm_calls WHERE expires_at<=?", (now,))
+        row = conn.execute("SELECT result FROM llm_calls WHERE call_key=?", (call_key,)).fetchone()
+        if row is not None:
+            return False, row[0]
+        conn.execute("INSERT INTO llm_calls (call_key, expires_at) VALUES (?, ?)", (call_key, expires_at))
+    return True, None
+
+@instrumented("db")
+def finish_llm_call(call_key, result, keep_seconds):
+    """Publishes an LLM call's result to waiting callers for `keep_seconds`, or withdraws the call if result is None."""
+    with get_connection(admission_path()) as conn:
+        if result is None:
+            conn.execute("DELETE FROM llm_calls WHERE call_key=?", (call_key,))
+        else:
+            conn.execute("UPDATE llm_calls SET result=?, expires_at=? WHERE call_key=?", (result, time.time() + keep_seconds, call_key))
+
+#--- Derived Data Rebuilds ---
+#One write transaction per shard; readers in running app processes see the
+#rebuilt data through the new query cache generations.
+def rebuild_all_rollups(user_id=None):
+    """Recomputes daily activity, streaks and the dashboard rollups from entries, for every user or just one."""
+    shards = [user_shard(user_id)] if user_id is not None else all_shards()
+    for shard in shards:
+        with get_connection(shard_path(shard)) as conn:
+            _begin_write(conn)
+            rebuild_rollups(conn, user_id)
+            _backfill_daily_activity(conn, user_id)
+            if user_id is None:
+                _bump_all_generations(conn)
+            else:
+                _bump_generation(conn, user_id)
+
+def rebuild_all_search_indexes():
+    """Rebuilds every shard's search index from its entries (e.g. after editing them with another tool)."""
+    for shard in all_shards():
+        with get_connection(shard_path(shard)) as conn:
+            _begin_write(conn)
+            rebuild_search_index(conn)
+            _bump_all_generations(conn)
+
+def recompress_all_entries():
+    """Rewrites every shard's stored entry text under the current compression settings. Returns the number of rows changed."""
+    changed = 0
+    for shard in all_shards():
+        with get_connection(shard_path(shard)) as conn:
+            _begin_write(conn)
+            #the text reads back the same, so cached results stay valid
+            changed += recompress_entries(conn) + recompress_entries(conn, table="entries_archive")
+    return changed
+
+#--- Maintenance ---
+#The steps behind maintenance.py. Each works on one database file, so callers
+#loop over all_shards(); the schedule itself lives in DB_PATH.
+@instrumented("db")
+def claim_maintenance_task(task, interval):
+    """Marks a task as started unless a process started it less than `interval` seconds ago. Returns True if claimed."""
+    now = time.time()
+    with get_connection() as conn:
+        _begin_write(conn)
+        row = conn.execute("SELECT started_at FROM maintenance_runs WHERE task=?", (task,)).fetchone()
+        if row is not None and now - row[0] < interval:
+            return False
+        conn.execute("INSERT OR REPLACE INTO maintenance_runs (task, started_at, finished_at, result) VALUES (?, ?, NULL, NULL)", (task, now))
+    return True
+
+@instrumented("db")
+def finish_maintenance_task(task, result):
+    """Records how a claimed task went."""
+    with get_connection() as conn:
+        conn.execute("UPDATE maintenance_runs SET finished_at=?, result=? WHERE task=?", (time.time(), result, task))
+
+def get_maintenance_runs():
+    """Returns (task, started_at, finished_at, result) for every task that has run."""
+    with get_connection() as conn:
+        return conn.execute("SELECT task, started_at, finished_at, result FROM maintenance_runs ORDER BY task").fetchall()
+
+def checkpoint_wal(path, mode="PASSIVE"):
+    """Copies a file's WAL back into the database. Returns (busy, WAL pages, pages checkpointed).
+
+    PASSIVE never waits: it copies what no reader still needs and leaves the
+    rest for the next run.
+    """
+    with get_connection(path) as conn:
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+def optimize_database(path):
+    """Runs PRAGMA optimize, which re-analyzes only the tables whose statistics have gone stale."""
+    with get_connection(path) as conn:
+        #caps the rows ANALYZE samples per index, so a large table costs no more than a small one
+        conn.execute("PRAGMA analysis_limit=400")
+        conn.execute("PRAGMA optimize")
+        _drop_shadow_stats(conn)
+
+def get_free_pages(path):
+    """Returns (incremental auto-vacuum enabled, free pages, total pages) for a database file."""
+    with get_connection(path) as conn:
+        return (
+            conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2,
+            conn.execute("PRAGMA freelist_count").fetchone()[0],
+            conn.execute("PRAGMA page_count").fetchone()[0],
+        )
+
+def incremental_vacuum(path, max_pages):
+    """Returns up to max_pages free pages to the filesystem. Returns the number of pages freed."""
+    with get_connection(path) as conn:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        #execute() would only step the pragma once, which frees a single page
+        conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+        return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def vacuum_database(path):
+    """Rebuilds a database file with a full VACUUM, which also switches it to incremental auto-vacuum.
+
+    Holds the write lock for the whole rebuild, so only run it off-peak.
+    """
+    with get_connection(path) as conn:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+def _integrity_problems(conn):
+    """Returns the problems PRAGMA quick_check finds on a connection's database (empty if it is sound)."""
+    rows = [row[0] for row in conn.execute("PRAGMA quick_check")]
+    return [] if rows == ["ok"] else rows
+
+def check_integrity(path):
+    """Returns the problems PRAGMA quick_check finds in a database file (empty if it is sound)."""
+    with get_connection(path) as conn:
+        return _integrity_problems(conn)
+
+def backup_database(path, target_path):
+    """Copies a live database file to target_path with SQLite's online backup API. Returns the copy's integrity problems.
+
+    The copy is made in one step inside a read transaction: under WAL that
+    never blocks writers, while a paced copy in small steps would start over
+    each time a session wrote in between.
+    """
+    target = sqlite3.connect(target_path)
+    try:
+        with get_connection(path) as conn:
+            conn.backup(target)
+        return _integrity_problems(target)
+    finally:
+        target.close()
+
+@instrumented("db")
+def archive_entries(shard, before_date, batch_size=ARCHIVE_BATCH_SIZE):
+    """Moves a shard's entries dated before before_date (ISO date) into entries_archive. Returns the number moved.
+
+    Archived entries keep their IDs and stay in every read but search
+    (journal_entries merges them back in); streaks and rollups are untouched
+    since the entries still count. Entries still waiting for their AI insight
+    are skipped. Each batch is its own short transaction, so sessions saving
+    entries meanwhile only ever wait for one batch.
+    """
+    moved = 0
+    user_ids = set()
+    last_id = 0
+    while True:
+        with get_connection(shard_path(shard)) as conn:
+            _begin_write(conn)
+            rows = conn.execute(
+                """
+                SELECT id, user_id, date, content, mood, ai_response FROM entries e
+                WHERE id > ? AND date < ? AND ai_response IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM ai_jobs j WHERE j.entry_id = e.id AND j.status IN ('pending', 'running'))
+                ORDER BY id LIMIT ?
+                """,
+                (last_id, before_date, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            #archived text is compressed however short it is
+            conn.executemany(
+                "INSERT INTO entries_archive (id, user_id, date, content, mood, ai_response) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (entry_id, user_id, date_str, compress_text(decompress_text(content), 0), mood, compress_text(decompress_text(ai_response), 0))
+                    for entry_id, user_id, date_str, content, mood, ai_response in rows
+                ],
+            )
+            entry_ids = [(row[0],) for row in rows]
+            conn.executemany("DELETE FROM ai_jobs WHERE entry_id=?", entry_ids)
+            conn.executemany("DELETE FROM entries WHERE id=?", entry_ids)
+            conn.executemany("DELETE FROM entries_fts WHERE rowid=?", entry_ids)
+            for user_id in {row[1] for row in rows}:
+                _bump_generation(conn, user_id)
+        last_id = rows[-1][0]
+        moved += len(rows)
+        user_ids.update(row[1] for row in rows)
+    for user_id in user_ids:
+        invalidate_user(user_id)
+    return moved
@@ -0,0 +1,48 @@
+"""Schema migrations, rebuilds of derived data and shard rebalancing.
+
+    python db_admin.py migrate
+    python db_admin.py rebuild-rollups --user 42
+    python db_admin.py rebalance --shards 4     # stop the app first
+"""
+import argparse
+import database
+from database import (
+    MIGRATIONS,
+    init_db,
+    rebuild_all_rollups,
+    recompress_all_entries,
+    rebuild_all_search_indexes,
+    rebalance_shards,
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="MindScribe database administration.")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the journal database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="apply pending schema migrations")
+    rebuild = commands.add_parser("rebuild-rollups", help="recompute the dashboard rollups and streaks from entries")
+    rebuild.add_argument("--user", type=int, help="only rebuild this user ID")
+    commands.add_parser("recompress", help="rewrite stored entry text under the current compression settings (see compression.py)")
+    commands.add_parser("rebuild-search", help="rebuild the full-text search index from entries (e.g. after editing them with another tool)")
+    rebalance = commands.add_parser("rebalance", help="spread users' journals over shard files (stop the app first)")
+    rebalance.add_argument("--shards", type=int, required=True, help="number of shard files; 0 moves everything back into --db")
+    args = parser.parse_args()
+    #configured through the one imported database module, so the modules that read its settings (related.py) see them too
+    database.configure_database(path=args.db)
+    init_db()
+    if args.command == "rebuild-rollups":
+        rebuild_all_rollups(args.user)
+        print("Rollups rebuilt.")
+    elif args.command == "recompress":
+        print(f"Rewrote {recompress_all_entries()} entries.")
+    elif args.command == "rebuild-search":
+        rebuild_all_search_indexes()
+        print("Search index rebuilt.")
+    elif args.command == "rebalance":
+        users_moved, entries_moved = rebalance_shards(args.shards)
+        print(f"Moved {users_moved} users ({entries_moved} entries).")
+    else:
+        print(f"Schema is at version {MIGRATIONS[-1][0]}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Week-in-review and year-in-review digests, summarised map-reduce style.
+
+A digest's entries are split into calendar chunks (a day for a week, a month
+for a year, so even a year costs at most 13 LLM calls). Each chunk is summarised on its own, in parallel, and the
+summaries are cached by the chunk's content, so a new entry only costs a new
+summary of its own chunk. The summaries are then combined, in rounds if they
+are too long for one prompt, into one creative piece in the style of an
+entry's AI insight.
+
+    python digest.py batch                  # precompute digests for recently active users now
+    python digest.py batch --at 03:00       # ... every night at 03:00
+    python digest.py show alice --period year
+"""
+import argparse
+import datetime
+import logging
+import os
+import textwrap
+import threading
+import time
+import tomllib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import database
+from database import init_db, get_entries_between, get_active_user_ids, get_user_id
+from ai import AI_MODEL, SYSTEM_PROMPT
+from ai_cache import make_cache_key, get_cached, put_cached
+from llm import chat_completion, configure_llm
+from admission import configure_admission
+from token_budget import INPUT_TOKEN_BUDGET, estimate_tokens, condense_text
+
+#--- Digest Configuration ---
+PERIODS = ("week", "year")
+DIGEST_PROMPT_VERSION = 1     # bump whenever a digest prompt changes so cached summaries are not reused
+CHUNK_SUMMARY_TOKENS = 120    # response tokens for one chunk's (or one reduce group's) summary
+DIGEST_RESPONSE_TOKENS = 350  # response tokens for the final creative piece
+MAP_PARALLELISM = 4           # chunk summaries requested at once (the shared LLM limits still apply)
+ACTIVE_DAYS = 7               # batch mode covers users who journaled within this many days
+DIGEST_WORKERS = 2            # digests the dashboard generates at once per server process
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(DIGEST_WORKERS, thread_name_prefix="digest")
+_progress = {}   # (user_id, period, end date) -> state of a digest generated for the dashboard
+_progress_lock = threading.Lock()
+
+SUMMARY_TEMPLATE = textwrap.dedent("""
+    Summarise these journal entries from {label} in two or three sentences.
+    Keep the events, the feelings and anything the writer keeps coming back to. Write in the second person ("you").
+
+    {entries}
+    """)
+
+DIGEST_TEMPLATE = textwrap.dedent("""
+    You are MindScribe - an AI-powered journal assistant.
+    Below is a summary of the user's journal over {label}. Turn it into a "{title}" that sparks powerful emotions.
+    Choose one of the following formats:
+    - A Poem
+    - A motivational quote
+    - A short humorous dramatic story
+    - A one-act play
+
+    Guidelines:
+    - Make it feel personal: call back to the real moments, moods and themes of the period.
+    - Show how the period moved - what changed, what stayed, what they got through.
+    - Make it engaging, creative, and memorable.
+
+    Here is the summary:
+    \"\"\"{summaries}\"\"\"
+    """)
+
+#--- Chunking Functions ---
+def period_range(period, end_date=None):
+    """Returns the (start, end) dates a digest covers: the 7 days up to end_date, or its calendar year so far."""
+    end = end_date or datetime.date.today()
+    if period == "week":
+        return end - datetime.timedelta(days=6), end
+    if period == "year":
+        return datetime.date(end.year, 1, 1), end
+    raise ValueError(f"Unknown digest period '{period}'. Choose one of: {', '.join(PERIODS)}")
+
+def chunk_entries(period, entries):
+    """Groups (date, mood, content) rows into [(label, rows)] calendar chunks, oldest first."""
+    chunks = {}
+    for row in entries:
+        day = datetime.date.fromisoformat(row[0])
+        label = day.strftime("%A %d %B") if period == "week" else day.strftime("%B")
+        chunks.setdefault(label, []).append(row)
+    return list(chunks.items())
+
+#--- Map-Reduce Functions ---
+def _summarise(label, text):
+    """Returns a short summary of text, from the cache when this exact text was summarised before."""
+    cache_key = make_cache_key("digest-summary", DIGEST_PROMPT_VERSION, AI_MODEL, label, text)
+    summary = get_cached(cache_key)
+    if summary is None:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": SUMMARY_TEMPLATE.format(label=label, entries=text)},
+        ]
+        summary = chat_completion(messages, model=AI_MODEL, temperature=0.3, max_tokens=CHUNK_SUMMARY_TOKENS).strip()
+        put_cached(cache_key, summary)
+    return summary
+
+def summarise_chunk(label, rows):
+    """Map step: summarises one chunk of entries, condensed to the prompt budget first."""
+    text = "\n".join(f"- {date_str} ({mood or 'no mood'}): {content}" for date_str, mood, content in rows)
+    return f"{label}: " + _summarise(label, condense_text(text, INPUT_TOKEN_BUDGET))
+
+def reduce_summaries(summaries, label, budget=INPUT_TOKEN_BUDGET):
+    """Reduce step: merges summaries, in rounds of groups that fit the budget, until they fit in one prompt."""
+    while estimate_tokens("\n".join(summaries)) > budget and len(summaries) > 1:
+        groups, group = [], []
+        for summary in summaries:
+            if group and estimate_tokens("\n".join(group + [summary])) > budget:
+                groups.append(group)
+                group = []
+            group.append(summary)
+        groups.append(group)
+        if len(groups) == len(summaries):
+            #every summary fills a prompt on its own, so merging cannot shrink them further
+            break
+        with ThreadPoolExecutor(MAP_PARALLELISM) as pool:
+            summaries = list(pool.map(lambda group: _summarise(label, "\n".join(group)), groups))
+    return condense_text("\n".join(summaries), budget)
+
+def generate_digest(user_id, period="week", end_date=None, on_progress=None):
+    """Returns the user's week- or year-in-review piece, or None if they wrote nothing in that period.
+
+    on_progress(done, total) is called as the chunk summaries come in. Raises
+    whatever the LLM call raises; every summary that was already finished
+    stays cached for the next attempt.
+    """
+    start, end = period_range(period, end_date)
+    entries = get_entries_between(user_id, start.isoformat(), end.isoformat())
+    if not entries:
+        return None
+    label = "the past week" if period == "week" else f"{end.year} so far"
+    chunks = chunk_entries(period, entries)
+    #the final piece counts as one more step
+    steps = len(chunks) + 1
+    with ThreadPoolExecutor(MAP_PARALLELISM) as pool:
+        futures = [pool.submit(summarise_chunk, *chunk) for chunk in chunks]
+        for done, _ in enumerate(as_completed(futures), 1):
+            if on_progress is not None:
+                on_progress(done, steps)
+        summaries = [future.result() for future in futures]
+    summary = reduce_summaries(summaries, label)
+    title = "Week in Review" if period == "week" else "Year in Review"
+    cache_key = make_cache_key("digest", DIGEST_PROMPT_VERSION, AI_MODEL, period, summary)
+    digest = get_cached(cache_key)
+    if digest is None:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": DIGEST_TEMPLATE.format(label=label, title=title, summaries=summary)},
+        ]
+        digest = chat_completion(messages, model=AI_MODEL, temperature=0.8, max_tokens=DIGEST_RESPONSE_TOKENS).strip()
+        put_cached(cache_key, digest)
+    return digest
+
+#--- Background Digest Functions ---
+#The dashboard generates digests here, off the session's thread, and polls
+#get_digest_progress until they are ready.
+def start_digest(user_id, period="week"):
+    """Starts generating a user's digest in the background unless it already is. Returns the key to poll it with."""
+    key = (user_id, period, datetime.date.today().isoformat())
+    with _progress_lock:
+        state = _progress.get(key)
+        if state is not None and not state["finished"]:
+            return key
+        _progress[key] = {"done": 0, "total": 0, "digest": None, "error": None, "finished": False}
+    _executor.submit(_run_digest, key)
+    return key
+
+def _update_progress(key, **changes):
+    """Updates the state of a background digest."""
+    with _progress_lock:
+        if key in _progress:
+            _progress[key].update(changes)
+
+def _run_digest(key):
+    """Generates a background digest, recording its progress and result."""
+    user_id, period, end = key
+    try:
+        digest = generate_digest(user_id, period, datetime.date.fromisoformat(end), lambda done, total: _update_progress(key, done=done, total=total))
+    except Exception as e:
+        logger.warning("Could not generate the %s digest of user %s: %s", period, user_id, e)
+        _update_progress(key, error=str(e), finished=True)
+    else:
+        _update_progress(key, digest=digest, finished=True)
+
+def get_digest_progress(key):
+    """Returns a copy of a background digest's state (done, total, digest, error, finished), or None if it is unknown."""
+    with _progress_lock:
+        state = _progress.get(key)
+        return dict(state) if state is not None else None
+
+def forget_digest(key):
+    """Drops a background digest's state once its result has been shown."""
+    with _progress_lock:
+        _progress.pop(key, None)
+
+#--- Batch Functions ---
+def precompute_digests(periods=PERIODS, active_days=ACTIVE_DAYS, end_date=None):
+    """Generates (and so caches) the digests of every recently active user. Returns (generated, failed) counts."""
+    end = end_date or datetime.date.today()
+    since = (end - datetime.timedelta(days=active_days - 1)).isoformat()
+    generated = failed = 0
+    for user_id in get_active_user_ids(since):
+        for period in periods:
+            try:
+                generate_digest(user_id, period, end)
+                generated += 1
+            except Exception as e:
+                logger.warning("Could not generate the %s digest of user %s: %s", period, user_id, e)
+                failed += 1
+    return generated, failed
+
+def seconds_until(clock_time, now=None):
+    """Returns the seconds from now until the next time the clock shows clock_time ("HH:MM")."""
+    now = now or datetime.datetime.now()
+    hour, minute = map(int, clock_time.split(":"))
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += datetime.timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+def _configure_from_secrets(db_path):
+    """Configures the database, LLM backend and LLM limits from the app's secrets file, as the app does."""
+    try:
+        with open(SECRETS_PATH, "rb") as f:
+            secrets = tomllib.load(f)
+    except FileNotFoundError:
+        secrets = {}
+    database.configure_database(path=db_path, shard_count=secrets.get("DB_SHARDS"))
+    configure_llm(
+        backend=secrets.get("LLM_BACKEND"),
+        api_url=secrets.get("LLM_API_URL"),
+        api_key=secrets.get("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY")),
+    )
+    configure_admission(
+        max_concurrent=secrets.get("LLM_MAX_CONCURRENT"),
+        calls_per_second=secrets.get("LLM_CALLS_PER_SECOND"),
+    )
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Generate MindScribe week- and year-in-review digests.")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the journal database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    batch = commands.add_parser("batch", help="precompute the digests of every recently active user")
+    batch.add_argument("--period", choices=PERIODS + ("all",), default="all")
+    batch.add_argument("--active-days", type=int, default=ACTIVE_DAYS, help="only users who journaled within this many days")
+    batch.add_argument("--at", metavar="HH:MM", help="keep running and repeat the batch every day at this local time (off-peak)")
+    show = commands.add_parser("show", help="print one user's digest")
+    show.add_argument("username")
+    show.add_argument("--period", choices=PERIODS, default="week")
+    args = parser.parse_args()
+    _configure_from_secrets(args.db)
+    init_db()
+    if args.command == "show":
+        user_id = get_user_id(args.username)
+        if user_id is None:
+            parser.error(f"No user named '{args.username}'.")
+        print(generate_digest(user_id, args.period) or f"No entries in the past {args.period}.")
+        return
+    periods = PERIODS if args.period == "all" else (args.period,)
+    while True:
+        if args.at:
+            time.sleep(seconds_until(args.at))
+        started = time.perf_counter()
+        generated, failed = precompute_digests(periods, args.active_days)
+        logger.info("Generated %d digests (%d failed) in %.1fs.", generated, failed, time.perf_counter() - started)
+        if not args.at:
+            break
+
+if __name__ == "__main__":
+    main()
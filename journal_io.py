@@ -0,0 +1,105 @@
+"""Export and import of journals as JSON Lines or CSV.
+
+    python journal_io.py export alice -o alice.jsonl
+    python journal_io.py import alice alice.jsonl
+    python journal_io.py export alice --format csv -o alice.csv
+"""
+import argparse
+import csv
+import datetime
+import json
+import sys
+import database
+from database import iter_user_entries, import_entries, get_user_id, init_db
+
+#--- Export & Import Configuration ---
+FORMATS = ("jsonl", "csv")
+FIELDS = ("date", "mood", "content", "ai_response")
+
+#--- Export & Import Functions ---
+def format_from_name(file_name):
+    """Guesses the format from a file name's extension, defaulting to JSON Lines."""
+    return "csv" if file_name.lower().endswith(".csv") else "jsonl"
+
+def export_journal(user_id, out, fmt="jsonl"):
+    """Writes every entry of a user to the text stream out, one row at a time. Returns the number written."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for row in iter_user_entries(user_id):
+            writer.writerow(row)
+            count += 1
+    elif fmt == "jsonl":
+        for row in iter_user_entries(user_id):
+            out.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Unknown format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+    return count
+
+def _records(stream, fmt):
+    """Yields one dictionary per entry in a JSON Lines or CSV text stream."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "jsonl":
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Unknown format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+
+def read_journal(stream, fmt="jsonl"):
+    """Yields validated (date, mood, content, ai_response) rows from an export, raising ValueError on a bad record."""
+    for number, record in enumerate(_records(stream, fmt), start=1):
+        try:
+            date_str = datetime.date.fromisoformat(str(record["date"]).strip()).isoformat()
+            content = record["content"]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Record {number} needs a content field and an ISO date (YYYY-MM-DD): {e}") from None
+        if not content or not str(content).strip():
+            raise ValueError(f"Record {number} has no content.")
+        #CSV has no null, so an empty cell means "no AI response yet"
+        yield date_str, record.get("mood") or None, str(content), record.get("ai_response") or None
+
+def import_journal(user_id, stream, fmt="jsonl"):
+    """Imports an export into a user's journal. Returns the number of entries added."""
+    return import_entries(user_id, read_journal(stream, fmt))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import MindScribe journals.")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the journal database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write a user's entries to a file (or stdout)")
+    export.add_argument("username")
+    export.add_argument("-o", "--output", help="file to write (default: stdout)")
+    export.add_argument("--format", choices=FORMATS, help="default: from the file extension, else jsonl")
+    imports = commands.add_parser("import", help="add the entries in a file to a user's journal")
+    imports.add_argument("username")
+    imports.add_argument("path", help="JSON Lines or CSV export")
+    imports.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    args = parser.parse_args()
+    database.DB_PATH = args.db
+    init_db()
+    user_id = get_user_id(args.username)
+    if user_id is None:
+        parser.error(f"No user named '{args.username}'.")
+    if args.command == "export":
+        fmt = args.format or format_from_name(args.output or "")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as out:
+                count = export_journal(user_id, out, fmt)
+        else:
+            count = export_journal(user_id, sys.stdout, fmt)
+        print(f"Exported {count} entries.", file=sys.stderr)
+    else:
+        fmt = args.format or format_from_name(args.path)
+        with open(args.path, encoding="utf-8", newline="") as stream:
+            try:
+                count = import_journal(user_id, stream, fmt)
+            except ValueError as e:
+                parser.exit(1, f"Import stopped: {e}\n")
+        print(f"Imported {count} entries.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import json
+import random
+import threading
+import time
+from metrics import span
+from admission import admit, call_key, join_call, finish_call, AdmissionTimeout
+
+#--- LLM Backend Configuration ---
+LLM_BACKEND = "openai"       # "openai" (official SDK) or "http" (any chat-completions endpoint, e.g. mock_llm_server.py)
+API_URL = "https://api.openai.com/v1/chat/completions"
+API_KEY = None
+CALL_DEADLINE = 30.0         # seconds a call may take in total, retries included
+MAX_RETRIES = 2              # extra attempts after a failed call
+BACKOFF_BASE = 0.5           # seconds before the first retry, doubled on each further retry
+BACKOFF_MAX = 8.0
+BREAKER_THRESHOLD = 5        # consecutive failures that open the circuit
+BREAKER_COOLDOWN = 30.0      # seconds the circuit stays open before a trial call
+
+class CircuitOpen(Exception):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+_breaker = {"failures": 0, "opened_at": None, "trial_running": False}
+_breaker_lock = threading.Lock()
+
+#--- Backends ---
+#A backend is a pair of functions taking (messages, params, timeout):
+#  complete -> the response text
+#  stream   -> an iterator of (text delta, finish_reason) tuples
+#The SDKs are imported on first use so that importing llm (and starting the
+#app) does not pay for loading whichever client the configured backend skips.
+def _openai():
+    """Imports the openai SDK and hands it the configured API key."""
+    import openai
+    if API_KEY is not None:
+        openai.api_key = API_KEY
+    return openai
+
+def _openai_complete(messages, params, timeout):
+    """Calls the chat-completions API through the official openai SDK."""
+    response = _openai().ChatCompletion.create(messages=messages, request_timeout=timeout, **params)
+    return response.choices[0].message.content
+
+def _openai_stream(messages, params, timeout):
+    """Streams the chat-completions API through the official openai SDK."""
+    response = _openai().ChatCompletion.create(messages=messages, request_timeout=timeout, stream=True, **params)
+    for chunk in response:
+        choice = chunk.choices[0]
+        yield choice.delta.get("content"), choice.get("finish_reason")
+
+def _http_headers():
+    """Returns the request headers for the plain HTTP backend."""
+    headers = {"Content-Type": "application/json"}
+    if API_KEY:
+        headers["Authorization"] = f"Bearer {API_KEY}"
+    return headers
+
+def _http_complete(messages, params, timeout):
+    """Calls a chat-completions endpoint over plain HTTP."""
+    import requests
+    response = requests.post(API_URL, headers=_http_headers(), json={"messages": messages, **params}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+def _http_stream(messages, params, timeout):
+    """Streams a chat-completions endpoint over plain HTTP (server-sent events)."""
+    import requests
+    with requests.post(API_URL, headers=_http_headers(), json={"messages": messages, "stream": True, **params}, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return
+            choice = json.loads(data)["choices"][0]
+            yield choice.get("delta", {}).get("content"), choice.get("finish_reason")
+
+BACKENDS = {
+    "openai": (_openai_complete, _openai_stream),
+    "http": (_http_complete, _http_stream),
+}
+
+def register_backend(name, complete, stream):
+    """Registers a custom LLM backend under a name usable with configure_llm."""
+    BACKENDS[name] = (complete, stream)
+
+def configure_llm(backend=None, api_url=None, api_key=None):
+    """Selects the LLM backend and its endpoint/credentials."""
+    global LLM_BACKEND, API_URL, API_KEY
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+        LLM_BACKEND = backend
+    if api_url is not None:
+        API_URL = api_url
+    if api_key is not None:
+        API_KEY = api_key
+
+#--- Circuit Breaker ---
+def _before_call():
+    """Raises CircuitOpen while the upstream is considered unhealthy; lets one trial call through after the cooldown."""
+    with _breaker_lock:
+        opened_at = _breaker["opened_at"]
+        if opened_at is None:
+            return
+        if time.monotonic() - opened_at < BREAKER_COOLDOWN or _breaker["trial_running"]:
+            raise CircuitOpen("The AI service is temporarily unavailable.")
+        _breaker["trial_running"] = True
+
+def _record_success():
+    """Closes the circuit after a successful call."""
+    with _breaker_lock:
+        _breaker.update(failures=0, opened_at=None, trial_running=False)
+
+def _record_failure():
+    """Counts a failed call, opening (or re-opening) the circuit once the threshold is hit."""
+    with _breaker_lock:
+        _breaker["failures"] += 1
+        if _breaker["trial_running"] or _breaker["failures"] >= BREAKER_THRESHOLD:
+            _breaker.update(opened_at=time.monotonic(), trial_running=False)
+
+def _record_not_called():
+    """Hands back a half-open trial that never reached the upstream (e.g. it was not admitted in time)."""
+    with _breaker_lock:
+        _breaker["trial_running"] = False
+
+def get_breaker_state():
+    """Returns "closed", "open" or "half-open" for monitoring."""
+    with _breaker_lock:
+        if _breaker["opened_at"] is None:
+            return "closed"
+        if _breaker["trial_running"] or time.monotonic() - _breaker["opened_at"] >= BREAKER_COOLDOWN:
+            return "half-open"
+        return "open"
+
+#--- LLM Call Functions ---
+def _backoff(attempt, remaining):
+    """Sleeps for a fully jittered exponential backoff, never past the deadline. Returns False if no time is left."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if delay >= remaining:
+        return False
+    time.sleep(delay)
+    return True
+
+def _complete_with_retries(messages, params, give_up_at):
+    """Calls the backend, each attempt admitted through the shared limits, retrying with jittered backoff."""
+    complete = BACKENDS[LLM_BACKEND][0]
+    for attempt in range(MAX_RETRIES + 1):
+        _before_call()
+        try:
+            with admit(give_up_at - time.monotonic()):
+                text = complete(messages, params, max(give_up_at - time.monotonic(), 0.1))
+        except AdmissionTimeout:
+            #the upstream was never called, so this says nothing about its health
+            _record_not_called()
+            raise
+        except Exception:
+            _record_failure()
+            if attempt == MAX_RETRIES or not _backoff(attempt, give_up_at - time.monotonic()):
+                raise
+            continue
+        _record_success()
+        return text
+
+def chat_completion(messages, deadline=CALL_DEADLINE, **params):
+    """Returns the completion text, retrying with jittered backoff until the deadline.
+
+    An identical request already in flight (in any session or process) is
+    waited for instead of sent again. Raises CircuitOpen while the breaker is
+    open, AdmissionTimeout if the call could not start before the deadline,
+    or the last backend error.
+    """
+    give_up_at = time.monotonic() + deadline
+    key = call_key(messages, params)
+    with span("llm", "chat_completion") as call:
+        text = join_call(key, deadline)
+        if text is None:
+            try:
+                text = _complete_with_retries(messages, params, give_up_at)
+            except BaseException:
+                finish_call(key)
+                raise
+            finish_call(key, text)
+        call.rows, call.size = 1, len(text or "")
+        return text
+
+def stream_chat_completion(messages, deadline=CALL_DEADLINE, **params):
+    """Yields (text delta, finish_reason) tuples from the backend.
+
+    Failures before the first delta are retried like chat_completion; once
+    text has been yielded the error is raised to the caller instead, since a
+    retry would repeat text it has already shown. Like chat_completion, an
+    identical request already in flight is waited for, and its text is then
+    yielded as a single delta.
+    """
+    stream = BACKENDS[LLM_BACKEND][1]
+    give_up_at = time.monotonic() + deadline
+    #shares calls with chat_completion: a follower gets the leader's whole text as one delta
+    key = call_key(messages, params)
+    #the span covers the whole stream, including the time the caller spends between deltas
+    with span("llm", "stream_chat_completion") as call:
+        text = join_call(key, deadline)
+        if text is not None:
+            call.rows, call.size = 1, len(text)
+            yield text, "stop"
+            return
+        received = []
+        finished = False
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                _before_call()
+                started = False
+                try:
+                    with admit(give_up_at - time.monotonic()):
+                        for delta, finish_reason in stream(messages, params, max(give_up_at - time.monotonic(), 0.1)):
+                            started = True
+                            call.rows += 1
+                            call.size += len(delta or "")
+                            received.append(delta or "")
+                            finished = finished or bool(finish_reason)
+                            yield delta, finish_reason
+                except GeneratorExit:
+                    #the caller stopped reading; the upstream itself was healthy
+                    _record_success()
+                    raise
+                except AdmissionTimeout:
+                    _record_not_called()
+                    raise
+                except Exception:
+                    _record_failure()
+                    if started or attempt == MAX_RETRIES or not _backoff(attempt, give_up_at - time.monotonic()):
+                        raise
+                    continue
+                _record_success()
+                return
+        finally:
+            #only a stream the model finished is worth handing to the callers waiting on it
+            finish_call(key, "".join(received) if finished else None)
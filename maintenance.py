@@ -0,0 +1,252 @@
+"""Keeps the journal databases compact, fast and backed up.
+
+A background thread in every server process looks for due tasks every
+CHECK_INTERVAL seconds. The schedule is kept in journal.db, so however many
+processes run, each task runs once per interval:
+
+- checkpoint: copies each file's WAL back into the database, without waiting on sessions
+- optimize: refreshes stale planner statistics and returns free pages to the filesystem
+- integrity, archive, backup: once a night during NIGHTLY_HOUR
+
+    python maintenance.py run                   # run every enabled task now
+    python maintenance.py run --task backup --backup-dir backups
+    python maintenance.py vacuum                # one-off: switch older files to incremental auto-vacuum
+    python maintenance.py status
+"""
+import argparse
+import calendar
+import datetime
+import logging
+import os
+import shutil
+import threading
+import time
+import database
+from database import (
+    init_db,
+    all_shards,
+    shard_path,
+    claim_maintenance_task,
+    finish_maintenance_task,
+    get_maintenance_runs,
+    checkpoint_wal,
+    optimize_database,
+    get_free_pages,
+    incremental_vacuum,
+    vacuum_database,
+    check_integrity,
+    backup_database,
+    archive_entries,
+)
+
+#--- Maintenance Configuration ---
+MAINTENANCE = True           # run the maintenance schedule on a background thread in every server process
+CHECK_INTERVAL = 60.0        # seconds between checks for due tasks
+CHECKPOINT_INTERVAL = 300.0  # seconds between WAL checkpoints
+OPTIMIZE_INTERVAL = 3600.0   # seconds between statistics refreshes and incremental vacuums
+NIGHTLY_HOUR = 3             # local hour (off-peak) in which the nightly tasks run
+NIGHTLY_INTERVAL = 20 * 3600.0  # seconds before a nightly task may run again (less than a day, more than the hour)
+VACUUM_MIN_FREE_PAGES = 256  # free pages a file must have before it is vacuumed
+VACUUM_MAX_PAGES = 2000      # pages freed per run, so one run never holds the write lock for long
+ARCHIVE_AFTER_MONTHS = 0     # move entries older than this many months out of the live table; 0 turns archival off
+BACKUP_DIR = None            # folder for the nightly online backups; None turns them off
+BACKUP_KEEP = 7              # nightly backups kept before the oldest is deleted
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_stats_lock = threading.Lock()
+_threads = []
+_threads_lock = threading.Lock()
+
+class MaintenanceError(Exception):
+    """Raised when a maintenance task finds a problem that needs a person to look at it."""
+
+def configure_maintenance(archive_after_months=None, backup_dir=None):
+    """Turns on archival of old entries and/or nightly backups into backup_dir."""
+    global ARCHIVE_AFTER_MONTHS, BACKUP_DIR
+    if archive_after_months is not None:
+        ARCHIVE_AFTER_MONTHS = int(archive_after_months)
+    if backup_dir is not None:
+        BACKUP_DIR = backup_dir
+
+#--- Maintenance Tasks ---
+#Each task returns a short summary for the schedule and raises on failure.
+def _database_files():
+    """Returns every database file: DB_PATH and its shards."""
+    return [shard_path(shard) for shard in all_shards()]
+
+def run_checkpoint():
+    """Checkpoints every file's WAL (PASSIVE: whatever a reader still needs waits for the next run)."""
+    copied = 0
+    for path in _database_files():
+        busy, wal_pages, checkpointed = checkpoint_wal(path)
+        copied += max(checkpointed, 0)
+    return f"{copied} pages checkpointed"
+
+def run_optimize():
+    """Refreshes stale planner statistics and vacuums files with enough free pages."""
+    freed = 0
+    for path in _database_files():
+        optimize_database(path)
+        incremental, free_pages, page_count = get_free_pages(path)
+        if free_pages < VACUUM_MIN_FREE_PAGES:
+            continue
+        if incremental:
+            freed += incremental_vacuum(path, VACUUM_MAX_PAGES)
+        else:
+            logger.info("%s has %d of %d pages free; run `python maintenance.py vacuum` off-peak to reclaim them.", path, free_pages, page_count)
+    return f"{freed} pages freed"
+
+def run_integrity_check():
+    """Runs PRAGMA quick_check on every file, raising MaintenanceError if any is damaged."""
+    for path in _database_files():
+        problems = check_integrity(path)
+        if problems:
+            raise MaintenanceError(f"{path} failed its integrity check: {'; '.join(problems[:5])}")
+    return "ok"
+
+def months_ago(months, today=None):
+    """Returns the date `months` calendar months before today (clamped to the end of a shorter month)."""
+    today = today or datetime.date.today()
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    return datetime.date(year, month + 1, min(today.day, calendar.monthrange(year, month + 1)[1]))
+
+def run_archive(months=None):
+    """Moves entries older than `months` (ARCHIVE_AFTER_MONTHS by default) into each shard's archive table."""
+    months = ARCHIVE_AFTER_MONTHS if months is None else months
+    if months <= 0:
+        return "archival is off"
+    before_date = months_ago(months).isoformat()
+    moved = sum(archive_entries(shard, before_date) for shard in all_shards())
+    return f"{moved} entries archived"
+
+def run_backup(backup_dir=None):
+    """Backs every file up into a new timestamped folder of backup_dir (BACKUP_DIR by default), keeping the newest BACKUP_KEEP."""
+    backup_dir = backup_dir or BACKUP_DIR
+    if not backup_dir:
+        return "backups are off"
+    os.makedirs(backup_dir, exist_ok=True)
+    target = os.path.join(backup_dir, datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+    #written under a temporary name, so a folder without it is always a complete backup
+    partial = target + ".partial"
+    os.makedirs(partial)
+    try:
+        for path in _database_files():
+            problems = backup_database(path, os.path.join(partial, os.path.basename(path)))
+            if problems:
+                raise MaintenanceError(f"The backup of {path} failed its integrity check: {'; '.join(problems[:5])}")
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    os.rename(partial, target)
+    for name in os.listdir(backup_dir):
+        if name.endswith(".partial") and os.path.join(backup_dir, name) != partial:
+            #left behind by a run that crashed
+            shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+    backups = sorted(name for name in os.listdir(backup_dir) if not name.endswith(".partial"))
+    for name in backups[:-BACKUP_KEEP]:
+        shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+    return f"backed up to {target}"
+
+TASKS = {
+    "checkpoint": run_checkpoint,
+    "optimize": run_optimize,
+    "integrity": run_integrity_check,
+    "archive": run_archive,
+    "backup": run_backup,
+}
+
+#--- Scheduler ---
+def _due_tasks(now):
+    """Returns the (task, interval) pairs that may run at a local time."""
+    tasks = [("checkpoint", CHECKPOINT_INTERVAL), ("optimize", OPTIMIZE_INTERVAL)]
+    if now.hour == NIGHTLY_HOUR:
+        tasks.append(("integrity", NIGHTLY_INTERVAL))
+        if ARCHIVE_AFTER_MONTHS > 0:
+            tasks.append(("archive", NIGHTLY_INTERVAL))
+        if BACKUP_DIR:
+            tasks.append(("backup", NIGHTLY_INTERVAL))
+    return tasks
+
+def _count(task, result):
+    """Adds one run of a task to the counters."""
+    with _stats_lock:
+        stats = _stats.setdefault(task, {"ok": 0, "failed": 0, "last_success": None})
+        stats[result] += 1
+        if result == "ok":
+            stats["last_success"] = time.time()
+
+def run_task(task, interval=0.0, **kwargs):
+    """Runs a task unless any process started it less than `interval` seconds ago. Returns its summary, or None if skipped."""
+    if not claim_maintenance_task(task, interval):
+        return None
+    started = time.perf_counter()
+    try:
+        summary = TASKS[task](**kwargs)
+    except Exception as e:
+        finish_maintenance_task(task, f"failed: {e}")
+        _count(task, "failed")
+        raise
+    finish_maintenance_task(task, summary)
+    _count(task, "ok")
+    logger.info("Maintenance task %s: %s (%.1fs)", task, summary, time.perf_counter() - started)
+    return summary
+
+def _maintenance_loop():
+    """Runs due tasks every CHECK_INTERVAL seconds, forever."""
+    while True:
+        time.sleep(CHECK_INTERVAL)
+        for task, interval in _due_tasks(datetime.datetime.now()):
+            try:
+                run_task(task, interval)
+            except Exception:
+                logger.exception("Maintenance task %s failed", task)
+
+def start_maintenance():
+    """Starts the maintenance thread once per server process (unless MAINTENANCE is off). Returns it, or None."""
+    if not MAINTENANCE:
+        return None
+    with _threads_lock:
+        if not _threads:
+            thread = threading.Thread(target=_maintenance_loop, name="db-maintenance", daemon=True)
+            thread.start()
+            _threads.append(thread)
+    return _threads[0]
+
+def get_maintenance_stats():
+    """Returns {task: {"ok", "failed", "last_success"}} for the tasks run by this process."""
+    with _stats_lock:
+        return {task: dict(stats) for task, stats in _stats.items()}
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="MindScribe database maintenance.")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the journal database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run maintenance tasks now")
+    run.add_argument("--task", choices=list(TASKS), action="append", help="task to run (repeatable; default: every enabled task)")
+    run.add_argument("--archive-months", type=int, help="archive entries older than this many months")
+    run.add_argument("--backup-dir", help="folder to back up into")
+    commands.add_parser("vacuum", help="rebuild every file with a full VACUUM, switching it to incremental auto-vacuum (blocks writers; run off-peak)")
+    commands.add_parser("status", help="show when each task last ran")
+    args = parser.parse_args()
+    database.configure_database(path=args.db)
+    init_db()
+    if args.command == "vacuum":
+        for path in _database_files():
+            before = os.path.getsize(path)
+            vacuum_database(path)
+            print(f"{path}: {before / 1e6:.1f} MB -> {os.path.getsize(path) / 1e6:.1f} MB")
+    elif args.command == "status":
+        for task, started_at, finished_at, result in get_maintenance_runs():
+            started = datetime.datetime.fromtimestamp(started_at).isoformat(sep=" ", timespec="seconds")
+            print(f"{task:12} {started}  {result or 'running (or interrupted)'}")
+    else:
+        configure_maintenance(archive_after_months=args.archive_months, backup_dir=args.backup_dir)
+        tasks = args.task or [task for task in TASKS if (task != "archive" or ARCHIVE_AFTER_MONTHS > 0) and (task != "backup" or BACKUP_DIR)]
+        for task in tasks:
+            print(f"{task}: {run_task(task)}")
+
+if __name__ == "__main__":
+    main()
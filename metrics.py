@@ -0,0 +1,298 @@
+import contextlib
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#--- Metrics Configuration ---
+SLOW_QUERY_THRESHOLD = 0.1   # seconds before a database call goes to the slow log
+SLOW_LLM_THRESHOLD = 10.0    # seconds before an LLM call goes to the slow log
+MEASURE_PAYLOADS = True      # estimate the characters each call returns
+PAYLOAD_SAMPLE_ROWS = 4      # rows measured in a large result before extrapolating to the rest
+PROFILE_DIR = "profiles"     # where cProfile captures of single reruns are written
+PROFILE_TOP = 25             # functions listed in the log for a captured rerun
+LOCK_WAIT_THRESHOLD = 0.001  # seconds spent getting SQLite's write lock before it counts as waiting on another writer
+
+slow_logger = logging.getLogger("mindscribe.slow")
+logger = logging.getLogger(__name__)
+
+#Totals per (kind, name), e.g. ("db", "get_all_entries") or ("llm", "chat_completion"),
+#and per page for whole reruns
+_calls = {}
+_pages = {}
+_lock_waits = {"acquired": 0, "waited": 0, "timeouts": 0, "seconds": 0.0, "max_seconds": 0.0}
+_lock = threading.Lock()
+#the rerun being timed on this thread (Streamlit runs each session's script on its own thread)
+_current = threading.local()
+
+#--- Measurement Functions ---
+def _row_count(value):
+    """Counts the rows in a result: the length of a collection, 0 for None, otherwise 1."""
+    if value is None:
+        return 0
+    if isinstance(value, (list, set, dict)):
+        return len(value)
+    return 1
+
+def _payload_size(value):
+    """Approximates the size of a result as the characters/bytes of every string in it."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    elif isinstance(value, set):
+        value = list(value)
+    elif not isinstance(value, (list, tuple)):
+        return 0
+    #walking every row of a large result would cost about as much as the query,
+    #so measure a sample and scale it up
+    sample = value[:PAYLOAD_SAMPLE_ROWS]
+    size = 0
+    for item in sample:
+        if isinstance(item, (str, bytes)):
+            size += len(item)
+        elif isinstance(item, (list, tuple, set, dict)):
+            size += _payload_size(item)
+    return size * len(value) // len(sample) if sample else 0
+
+def _record(kind, name, seconds, rows, size, error):
+    """Adds one call to the totals, the current rerun and, if it was slow, the slow log."""
+    with _lock:
+        totals = _calls.setdefault((kind, name), {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "bytes": 0})
+        totals["count"] += 1
+        totals["errors"] += error
+        totals["seconds"] += seconds
+        totals["max_seconds"] = max(totals["max_seconds"], seconds)
+        totals["rows"] += rows
+        totals["bytes"] += size
+    rerun = getattr(_current, "rerun", None)
+    if rerun is not None:
+        rerun[kind] = rerun.get(kind, 0.0) + seconds
+    threshold = SLOW_LLM_THRESHOLD if kind == "llm" else SLOW_QUERY_THRESHOLD
+    if seconds > threshold:
+        slow_logger.warning("slow %s call %s took %.3fs (%d rows, %d bytes)%s", kind, name, seconds, rows, size, " and failed" if error else "")
+
+def record_lock_wait(seconds, timed_out=False):
+    """Counts one attempt to take a database's write lock and how long it took."""
+    with _lock:
+        _lock_waits["acquired"] += not timed_out
+        _lock_waits["timeouts"] += timed_out
+        _lock_waits["waited"] += seconds > LOCK_WAIT_THRESHOLD
+        _lock_waits["seconds"] += seconds
+        _lock_waits["max_seconds"] = max(_lock_waits["max_seconds"], seconds)
+
+class Span:
+    """One timed call. Callers that know their result size set rows/size before the span ends."""
+    __slots__ = ("rows", "size")
+
+    def __init__(self):
+        self.rows = 0
+        self.size = 0
+
+@contextlib.contextmanager
+def span(kind, name):
+    """Times the enclosed block as one call of kind/name."""
+    current = Span()
+    started = time.perf_counter()
+    error = False
+    try:
+        yield current
+    except GeneratorExit:
+        #a generator closed early by its consumer did not fail
+        raise
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _record(kind, name, time.perf_counter() - started, current.rows, current.size, error)
+
+def instrumented(kind):
+    """Decorator recording the duration, row count and payload size of every call to a function."""
+    def decorator(func):
+        name = func.__name__
+        #timed inline rather than through span() to keep the per-call overhead down
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                _record(kind, name, time.perf_counter() - started, 0, 0, True)
+                raise
+            seconds = time.perf_counter() - started
+            _record(kind, name, seconds, _row_count(result), _payload_size(result) if MEASURE_PAYLOADS else 0, False)
+            return result
+        return wrapper
+    return decorator
+
+#--- Rerun Functions ---
+def begin_rerun():
+    """Starts timing a script rerun on the current thread."""
+    _current.rerun = {"started": time.perf_counter()}
+
+def end_rerun(page):
+    """Stops timing the current rerun and adds it to the page's totals. Returns its breakdown in seconds."""
+    rerun = getattr(_current, "rerun", None)
+    if rerun is None:
+        return None
+    _current.rerun = None
+    total = time.perf_counter() - rerun.pop("started")
+    #whatever was not spent in SQLite or the LLM went to building widgets
+    breakdown = {"total": total, "db": rerun.get("db", 0.0), "llm": rerun.get("llm", 0.0)}
+    breakdown["ui"] = max(0.0, total - breakdown["db"] - breakdown["llm"])
+    with _lock:
+        totals = _pages.setdefault(page, {"count": 0, "max_seconds": 0.0, "total": 0.0, "db": 0.0, "llm": 0.0, "ui": 0.0})
+        totals["count"] += 1
+        totals["max_seconds"] = max(totals["max_seconds"], total)
+        for part, seconds in breakdown.items():
+            totals[part] += seconds
+    return breakdown
+
+@contextlib.contextmanager
+def fragment_rerun(page):
+    """Times the enclosed fragment as a rerun of its own when Streamlit reruns just that fragment.
+
+    During a full rerun the fragment is already part of the rerun being timed,
+    so nothing extra is recorded.
+    """
+    if getattr(_current, "rerun", None) is not None:
+        yield
+        return
+    begin_rerun()
+    try:
+        yield
+    finally:
+        end_rerun(page)
+
+@contextlib.contextmanager
+def profile_rerun(enabled, label="rerun"):
+    """Captures the enclosed block with cProfile when enabled, saving it to PROFILE_DIR and logging the top functions."""
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        logger.info("Profile of %s saved to %s\n%s", label, path, report.getvalue())
+
+#--- Reporting Functions ---
+def get_metrics():
+    """Returns copies of the per-call and per-page totals."""
+    with _lock:
+        calls = {key: dict(totals) for key, totals in _calls.items()}
+        pages = {page: dict(totals) for page, totals in _pages.items()}
+    return calls, pages
+
+def get_lock_wait_stats():
+    """Returns a copy of the write-lock counters."""
+    with _lock:
+        return dict(_lock_waits)
+
+def reset_metrics():
+    """Clears every total (e.g. between benchmark runs)."""
+    with _lock:
+        _calls.clear()
+        _pages.clear()
+        _lock_waits.update(acquired=0, waited=0, timeouts=0, seconds=0.0, max_seconds=0.0)
+
+def _label(value):
+    """Escapes a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus():
+    """Returns every metric in the Prometheus text exposition format."""
+    #imported here because these modules import database, which imports this one
+    from ai_cache import get_cache_stats
+    from query_cache import get_query_cache_stats
+    from llm import get_breaker_state
+    from admission import get_admission_stats
+    from token_budget import get_token_stats
+    from maintenance import get_maintenance_stats
+    calls, pages = get_metrics()
+    lines = []
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    call_labels = [({"kind": kind, "function": name}, totals) for (kind, name), totals in sorted(calls.items())]
+    metric("mindscribe_calls_total", "counter", "Instrumented database and LLM calls.", [(labels, t["count"]) for labels, t in call_labels])
+    metric("mindscribe_call_errors_total", "counter", "Instrumented calls that raised.", [(labels, t["errors"]) for labels, t in call_labels])
+    metric("mindscribe_call_seconds_total", "counter", "Time spent in instrumented calls.", [(labels, round(t["seconds"], 6)) for labels, t in call_labels])
+    metric("mindscribe_call_seconds_max", "gauge", "Slowest single instrumented call.", [(labels, round(t["max_seconds"], 6)) for labels, t in call_labels])
+    metric("mindscribe_call_rows_total", "counter", "Rows returned by instrumented calls.", [(labels, t["rows"]) for labels, t in call_labels])
+    metric("mindscribe_call_bytes_total", "counter", "Characters returned by instrumented calls.", [(labels, t["bytes"]) for labels, t in call_labels])
+    metric("mindscribe_reruns_total", "counter", "Full script reruns per page.", [({"page": page}, t["count"]) for page, t in sorted(pages.items())])
+    metric("mindscribe_rerun_seconds_total", "counter", "Rerun time per page, split into db, llm and ui (widget construction).",
+           [({"page": page, "part": part}, round(t[part], 6)) for page, t in sorted(pages.items()) for part in ("total", "db", "llm", "ui")])
+    metric("mindscribe_rerun_seconds_max", "gauge", "Slowest rerun per page.", [({"page": page}, round(t["max_seconds"], 6)) for page, t in sorted(pages.items())])
+    lock_stats = get_lock_wait_stats()
+    metric("mindscribe_sqlite_write_locks_total", "counter", "Write transactions by whether they got the lock at once, waited for another writer, or timed out.",
+           [({"result": "immediate"}, lock_stats["acquired"] - lock_stats["waited"]), ({"result": "waited"}, lock_stats["waited"]), ({"result": "timeout"}, lock_stats["timeouts"])])
+    metric("mindscribe_sqlite_lock_wait_seconds_total", "counter", "Time spent getting SQLite write locks.", [({}, round(lock_stats["seconds"], 6))])
+    metric("mindscribe_sqlite_lock_wait_seconds_max", "gauge", "Longest wait for a SQLite write lock.", [({}, round(lock_stats["max_seconds"], 6))])
+    query_stats = get_query_cache_stats()
+    metric("mindscribe_query_cache_lookups_total", "counter", "Per-user query cache lookups.",
+           [({"result": "hit"}, query_stats["hits"]), ({"result": "miss"}, query_stats["misses"])])
+    metric("mindscribe_query_cache_size", "gauge", "Results held by the query cache.", [({}, query_stats["size"])])
+    ai_stats = get_cache_stats()
+    metric("mindscribe_ai_cache_lookups_total", "counter", "AI response cache lookups.",
+           [({"result": "memory_hit"}, ai_stats["memory_hits"]), ({"result": "db_hit"}, ai_stats["db_hits"]), ({"result": "miss"}, ai_stats["misses"])])
+    metric("mindscribe_ai_cache_memory_size", "gauge", "AI responses held in memory.", [({}, ai_stats["memory_size"])])
+    token_stats = get_token_stats()
+    metric("mindscribe_prompt_entries_total", "counter", "Entries prepared for the LLM, and how many were condensed to fit the token budget.",
+           [({"result": "as_is"}, token_stats["entries"] - token_stats["condensed"]), ({"result": "condensed"}, token_stats["condensed"])])
+    metric("mindscribe_prompt_tokens_total", "counter", "Estimated entry tokens before and after condensing.",
+           [({"stage": "original"}, token_stats["tokens_in"]), ({"stage": "sent"}, token_stats["tokens_sent"])])
+    admission_stats = get_admission_stats()
+    metric("mindscribe_llm_admissions_total", "counter", "LLM calls let through the shared limits, and callers that gave up waiting.",
+           [({"result": "admitted"}, admission_stats["admitted"]), ({"result": "timeout"}, admission_stats["timeouts"])])
+    metric("mindscribe_llm_admission_wait_seconds_total", "counter", "Time LLM calls spent queued for a slot.", [({}, round(admission_stats["wait_seconds"], 6))])
+    metric("mindscribe_llm_coalesced_total", "counter", "LLM calls answered by an identical call already in flight.", [({}, admission_stats["coalesced"])])
+    maintenance_stats = get_maintenance_stats()
+    metric("mindscribe_maintenance_runs_total", "counter", "Database maintenance task runs by this process.",
+           [({"task": task, "result": result}, stats[result]) for task, stats in sorted(maintenance_stats.items()) for result in ("ok", "failed")])
+    metric("mindscribe_maintenance_last_success_timestamp_seconds", "gauge", "When each maintenance task last succeeded in this process.",
+           [({"task": task}, round(stats["last_success"], 3)) for task, stats in sorted(maintenance_stats.items()) if stats["last_success"]])
+    breaker = get_breaker_state()
+    metric("mindscribe_llm_circuit_state", "gauge", "1 for the circuit breaker's current state.",
+           [({"state": state}, int(state == breaker)) for state in ("closed", "half-open", "open")])
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves GET /metrics in the Prometheus text format."""
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        data = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Keeps scrapes out of the console."""
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics on a background thread. Returns the server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,118 @@
+"""A local stand-in for the chat-completions API, for load tests and offline development.
+
+Run it and point the app at it through .streamlit/secrets.toml:
+
+    python mock_llm_server.py --port 8765 --latency 1.5 --error-rate 0.1
+
+    LLM_BACKEND = "http"
+    LLM_API_URL = "http://127.0.0.1:8765/v1/chat/completions"
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#--- Mock Server Configuration ---
+MOCK_CONFIG = {
+    "latency": 0.5,       # mean seconds before the first byte
+    "jitter": 0.2,        # +/- seconds added to the latency
+    "token_delay": 0.02,  # seconds between streamed tokens
+    "error_rate": 0.0,    # fraction of requests answered with HTTP 500
+    "cutoff_rate": 0.0,   # fraction of streams dropped halfway through
+}
+MOCK_REPLIES = [
+    "A Poem:\nYou wrote of {topic}, and the page leaned in to listen;\neven the quiet lines in you glisten.",
+    "\"{topic}\" - today's chapter, not the whole book. Keep turning pages; the best plot twists are still ahead.",
+    "A One-Act Play:\nYOU: ({topic}) Is this it?\nTOMORROW: (grinning) Oh, I'm just getting started.",
+]
+
+def mock_reply(messages):
+    """Builds a creative-looking reply that quotes the journal entry from the last user message."""
+    content = messages[-1]["content"] if messages else ""
+    #MindScribe prompts wrap the entry in triple quotes
+    parts = content.split('"""')
+    entry = parts[1] if len(parts) >= 3 else content
+    topic = " ".join(entry.split()[:6]) or "your day"
+    return random.choice(MOCK_REPLIES).format(topic=topic)
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/chat/completions like the real API, with injected latency and failures."""
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(max(0.0, MOCK_CONFIG["latency"] + random.uniform(-MOCK_CONFIG["jitter"], MOCK_CONFIG["jitter"])))
+        if random.random() < MOCK_CONFIG["error_rate"]:
+            self._send_json(500, {"error": {"message": "mock upstream error", "type": "server_error"}})
+            return
+        text = mock_reply(body.get("messages", []))
+        if body.get("stream"):
+            self._stream(text)
+        else:
+            self._send_json(200, {
+                "id": "mock-completion",
+                "object": "chat.completion",
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            })
+
+    def _send_json(self, status, payload):
+        """Writes a JSON response."""
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, text):
+        """Writes the reply as server-sent events, one word per chunk."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        tokens = text.split(" ")
+        cut_at = len(tokens) // 2 if random.random() < MOCK_CONFIG["cutoff_rate"] else None
+        for i, token in enumerate(tokens):
+            if i == cut_at:
+                return
+            chunk = {"choices": [{"index": 0, "delta": {"content": token if i == 0 else " " + token}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(MOCK_CONFIG["token_delay"])
+        done = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+
+    def log_message(self, format, *args):
+        """Keeps the console quiet under load."""
+
+def start_mock_server(port=0, **config):
+    """Starts the mock server on a background thread. Returns (server, chat-completions URL)."""
+    MOCK_CONFIG.update(config)
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockChatHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the chat-completions API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=MOCK_CONFIG["latency"], help="mean seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=MOCK_CONFIG["jitter"], help="+/- seconds of latency jitter")
+    parser.add_argument("--token-delay", type=float, default=MOCK_CONFIG["token_delay"], help="seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=MOCK_CONFIG["error_rate"], help="fraction of requests that fail with HTTP 500")
+    parser.add_argument("--cutoff-rate", type=float, default=MOCK_CONFIG["cutoff_rate"], help="fraction of streams cut off halfway")
+    args = parser.parse_args()
+    MOCK_CONFIG.update(latency=args.latency, jitter=args.jitter, token_delay=args.token_delay, error_rate=args.error_rate, cutoff_rate=args.cutoff_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockChatHandler)
+    print(f"Mock chat-completions API on http://127.0.0.1:{args.port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
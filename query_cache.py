@@ -0,0 +1,95 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+#--- Query Cache Configuration ---
+MAX_CACHED_RESULTS = 4096   # results kept across all users before the least recently used are dropped
+MAX_RESULT_AGE = 300.0      # seconds a result is served at most, a backstop for writes made outside the app (e.g. the sqlite3 shell)
+GENERATION_CHECK_INTERVAL = 2.0  # seconds a user's shared generation is trusted before it is read from the database again
+
+#Every user has a generation number that write paths bump. A cached result
+#remembers the generation it was read under and is only served while that is
+#still current, so a write invalidates all of the user's results at once.
+#Writes by other processes (AI workers, imports, maintenance) only bump the
+#shared generation the database keeps, read through the function registered
+#with set_generation_source, so a lookup checks both. The shared one is read
+#at most once per GENERATION_CHECK_INTERVAL per user, so a rerun soon after the
+#last one makes no database calls and other processes' writes show up within
+#the interval.
+_generations = {}
+_generation_source = None
+_shared_generations = {}   # user_id -> (shared generation, monotonic time it was read)
+_results = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "generation_reads": 0}
+
+#--- Query Cache Functions ---
+def _shared_generation(user_id, now):
+    """Returns the user's shared generation, reading it from the source at most every GENERATION_CHECK_INTERVAL seconds."""
+    if _generation_source is None:
+        return None
+    with _lock:
+        known = _shared_generations.get(user_id)
+    if known is not None and now - known[1] < GENERATION_CHECK_INTERVAL:
+        return known[0]
+    generation = _generation_source(user_id)
+    with _lock:
+        _shared_generations[user_id] = (generation, now)
+        _stats["generation_reads"] += 1
+    return generation
+
+def cached_per_user(func):
+    """Caches a read function whose first argument is a user ID until that user's data changes."""
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        key = (func.__name__, user_id, args, tuple(sorted(kwargs.items())))
+        #the generations are read before the query, so a write that lands while
+        #we read leaves this result stale-tagged and it is never served
+        now = time.monotonic()
+        shared = _shared_generation(user_id, now)
+        with _lock:
+            generation = (_generations.get(user_id, 0), shared)
+            hit = _results.get(key)
+            if hit is not None and hit[0] == generation and now - hit[2] < MAX_RESULT_AGE:
+                _results.move_to_end(key)
+                _stats["hits"] += 1
+                return hit[1]
+            _stats["misses"] += 1
+        value = func(user_id, *args, **kwargs)
+        with _lock:
+            _results[key] = (generation, value, now)
+            _results.move_to_end(key)
+            while len(_results) > MAX_CACHED_RESULTS:
+                _results.popitem(last=False)
+        return value
+    return wrapper
+
+def set_generation_source(func):
+    """Registers func(user_id) -> the user's generation shared by every process."""
+    global _generation_source
+    _generation_source = func
+
+def invalidate_user(user_id):
+    """Marks every cached result for a user as stale. Call after the write has committed."""
+    with _lock:
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+        #our own write changed the shared generation too; read the new one on the next lookup
+        _shared_generations.pop(user_id, None)
+        _stats["invalidations"] += 1
+
+def clear_query_cache():
+    """Drops every cached result (e.g. when the database file is swapped out)."""
+    with _lock:
+        _results.clear()
+        _generations.clear()
+        _shared_generations.clear()
+
+def get_query_cache_stats():
+    """Returns hit/miss counters, the hit rate and the number of cached results."""
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_results)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,195 @@
+import contextlib
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+import numpy as np
+from token_budget import STOPWORDS
+
+try:
+    import fcntl
+except ImportError:
+    #not on Windows, where only this process's threads are kept apart
+    fcntl = None
+
+#--- Related Entries Configuration ---
+EMBEDDING_DIM = 512        # hashed bag-of-words buckets per entry vector
+RELATED_COUNT = 3          # similar entries shown for an entry
+MIN_SIMILARITY = 0.15      # cosine similarity below which an entry is not considered related
+COMPACT_RATIO = 0.5        # rewrite a user's files once this share of rows is deleted
+
+#Each user has two append-only files under <DB_PATH without extension>-vectors/:
+#  user-<id>.vec  float32 rows of EMBEDDING_DIM, L2-normalised, memory-mapped for queries
+#  user-<id>.ids  the entry ID of each row (int64), -1 once the entry is deleted
+#Writers hold user-<id>.lock, so the rows of the two files always pair up.
+#The files are only a derived index: when they disagree with the database (an
+#import, a shard move, a crash between two writes) they are rebuilt from it.
+_lock = threading.Lock()
+_write_lock = threading.Lock()
+_loaded = {}   # (vec path) -> (file stamp, ids, matrix, live rows, highest ID)
+
+#--- Embedding Functions ---
+def _bucket(word):
+    """Maps a word to a (bucket, sign) pair with a hash that is stable across processes."""
+    h = zlib.crc32(word.encode())
+    return h % EMBEDDING_DIM, 1.0 if h & 0x80000000 else -1.0
+
+def embed(text):
+    """Returns the L2-normalised hashed bag-of-words vector of a text (all zeros if it has no words)."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = [word for word in re.findall(r"[a-z']+", (text or "").lower()) if word not in STOPWORDS and len(word) > 2]
+    for word, count in Counter(words).items():
+        bucket, sign = _bucket(word)
+        #sublinear term frequency so one repeated word cannot dominate
+        vector[bucket] += sign * (1.0 + math.log(count))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+#--- Index Files ---
+def _paths(user_id):
+    """Returns the (vectors, ids) file paths of a user's index."""
+    import database
+    root = os.path.splitext(database.DB_PATH)[0] + "-vectors"
+    return os.path.join(root, f"user-{user_id}.vec"), os.path.join(root, f"user-{user_id}.ids")
+
+@contextlib.contextmanager
+def _locked(user_id):
+    """Holds a user's index lock while its files are written, across threads and (where fcntl exists) processes."""
+    vec_path, _ = _paths(user_id)
+    os.makedirs(os.path.dirname(vec_path), exist_ok=True)
+    with _write_lock, open(os.path.splitext(vec_path)[0] + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def _append(user_id, rows):
+    """Appends (entry_id, vector) rows to a user's index files. Hold _locked(user_id)."""
+    vec_path, ids_path = _paths(user_id)
+    with open(vec_path, "ab") as f:
+        f.write(np.asarray([vector for _, vector in rows], dtype=np.float32).reshape(-1, EMBEDDING_DIM).tobytes())
+    with open(ids_path, "ab") as f:
+        f.write(np.asarray([entry_id for entry_id, _ in rows], dtype=np.int64).tobytes())
+
+def _remove(user_id):
+    """Deletes a user's index files. Hold _locked(user_id)."""
+    for path in _paths(user_id):
+        with _lock:
+            _loaded.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _stamp(user_id):
+    """Returns (vec size, ids size, ids mtime) of a user's index, None if it is missing or its two files disagree."""
+    vec_path, ids_path = _paths(user_id)
+    try:
+        vec_stat, ids_stat = os.stat(vec_path), os.stat(ids_path)
+    except OSError:
+        return None
+    if vec_stat.st_size % (EMBEDDING_DIM * 4) or vec_stat.st_size // (EMBEDDING_DIM * 4) != ids_stat.st_size / 8:
+        return None
+    return vec_stat.st_size, ids_stat.st_size, ids_stat.st_mtime_ns
+
+def _load(user_id):
+    """Returns (ids, matrix, live rows, highest ID) memory-mapped from a user's index, or None if there is no usable index."""
+    vec_path, ids_path = _paths(user_id)
+    stamp = _stamp(user_id)
+    if stamp is None and os.path.exists(vec_path):
+        #an append in progress, or one a crash cut short: look again once the writer is done
+        with _locked(user_id):
+            stamp = _stamp(user_id)
+    if stamp is None:
+        return None
+    with _lock:
+        cached = _loaded.get(vec_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1:]
+    rows = stamp[0] // (EMBEDDING_DIM * 4)
+    if rows == 0:
+        ids, matrix = np.zeros(0, dtype=np.int64), np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    else:
+        ids = np.fromfile(ids_path, dtype=np.int64, count=rows)
+        matrix = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(rows, EMBEDDING_DIM))
+    loaded = (ids, matrix, int(np.count_nonzero(ids >= 0)), int(ids.max()) if rows else -1)
+    with _lock:
+        _loaded[vec_path] = (stamp,) + loaded
+    return loaded
+
+def drop_index(user_id):
+    """Deletes a user's index so it is rebuilt from the database on next use."""
+    with _locked(user_id):
+        _remove(user_id)
+
+def rebuild_index(user_id):
+    """Rebuilds a user's index from every entry in the database. Returns the number of entries indexed."""
+    from database import iter_user_entry_texts
+    rows = [(entry_id, embed(content)) for entry_id, content in iter_user_entry_texts(user_id)]
+    with _locked(user_id):
+        _remove(user_id)
+        #written even when empty, so a user without entries is not rebuilt on every query
+        _append(user_id, rows)
+    return len(rows)
+
+#--- Index Maintenance ---
+def index_entry(user_id, entry_id, content):
+    """Adds a newly saved entry to its owner's index."""
+    vec_path, _ = _paths(user_id)
+    vector = embed(content)
+    with _locked(user_id):
+        #without an index there is nothing to keep in step; the first query builds it
+        if os.path.exists(vec_path):
+            _append(user_id, [(entry_id, vector)])
+
+def unindex_entry(user_id, entry_id):
+    """Marks a deleted entry's row in its owner's index, compacting the files once enough rows are dead."""
+    vec_path, ids_path = _paths(user_id)
+    if not os.path.exists(ids_path):
+        return
+    with _locked(user_id):
+        #read under the lock, so a row appended meanwhile is not overwritten
+        ids = np.fromfile(ids_path, dtype=np.int64) if os.path.exists(ids_path) else np.zeros(0, dtype=np.int64)
+        positions = np.flatnonzero(ids == entry_id)
+        if not len(positions):
+            return
+        if np.count_nonzero(ids < 0) + len(positions) >= len(ids) * COMPACT_RATIO:
+            _remove(user_id)
+            return
+        with open(ids_path, "r+b") as f:
+            for position in positions:
+                f.seek(int(position) * 8)
+                f.write(np.int64(-1).tobytes())
+        with _lock:
+            _loaded.pop(vec_path, None)
+
+def _index(user_id):
+    """Returns (ids, matrix) for a user, (re)building the index if it is missing or out of step with the database."""
+    from database import get_total_entries, get_last_entry_id
+    loaded = _load(user_id)
+    #both reads are served by the query cache; a shard move renumbers entries and
+    #a delete followed by a save keeps the count, but either changes the highest ID
+    last_id = get_last_entry_id(user_id)
+    if loaded is None or loaded[2:] != (get_total_entries(user_id), -1 if last_id is None else last_id):
+        rebuild_index(user_id)
+        loaded = _load(user_id)
+    return loaded[:2]
+
+#--- Related Entries Functions ---
+def related_entries(user_id, text, k=RELATED_COUNT, exclude=()):
+    """Returns up to k (entry_id, similarity) pairs of the user's entries most similar to text, best first."""
+    query = embed(text)
+    if not query.any():
+        return []
+    ids, matrix = _index(user_id)
+    if not len(ids):
+        return []
+    scores = np.asarray(matrix @ query)
+    scores[ids < 0] = -1.0
+    if exclude:
+        scores[np.isin(ids, list(exclude))] = -1.0
+    k = min(k, len(ids))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(ids[i]), float(scores[i])) for i in top if scores[i] >= MIN_SIMILARITY]
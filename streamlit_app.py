@@ -1,56 +1,56 @@
 import streamlit as st
-import sqlite3
-import hashlib
 import datetime
-import requests
-import json
+import functools
+import calendar
+import io
+import logging
 import time
 import random
-import textwrap
-import os
-import openai
-
-#--- DataBase & Authentication Configuration ---
-DB_PATH = "journal.db"
-API_URL = "https://api.openai.com/v1/chat/completions"
-
-#--- DataBase Functions ---
-def init_db():
-    """Initializes the SQLite database and creates tables if they don't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    #create users tablefor login and security
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-             id INTEGER PRIMARY KEY,
-             username TEXT UNIQUE NOT NULL,
-             password TEXT NOT NULL,
-             passcode TEXT
-        );
-    """)
-    #create journal entries table (to be used later)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS entries (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            content TEXT NOT NULL,
-            mood TEXT,
-            ai_response TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-    """)
-    #create streaks table to track streaks (to be used later)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS streaks (
-            user_id INTEGER PRIMARY KEY,
-            streak_count INTEGER DEFAULT 0,
-            last_entry_date TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-    """)
-    conn.commit()
-    conn.close()
+from database import (
+    configure_database,
+    init_db,
+    register_user,
+    login_user,
+    get_username,
+    set_security_key,
+    get_user_passcode,
+    save_entry,
+    delete_entry,
+    get_streak,
+    get_longest_streak,
+    get_total_entries,
+    get_entry_headers,
+    get_entry,
+    search_entries,
+    get_mood_trends,
+    get_weekday_counts,
+    get_average_entry_length,
+    get_journaled_days,
+    get_ai_status,
+    get_entry_summaries,
+    ENTRY_PAGE_SIZE,
+)
+from ai_worker import start_workers, notify_workers
+from related import related_entries
+from digest import start_digest, get_digest_progress, forget_digest
+from journal_io import export_journal, import_journal, format_from_name, FORMATS
+from llm import configure_llm
+from admission import configure_admission
+from maintenance import configure_maintenance, start_maintenance
+from metrics import begin_rerun, end_rerun, fragment_rerun, profile_rerun, start_metrics_server
+
+#--- API Configuration ---
+AI_POLL_INTERVAL = 0.5  # seconds between checks for a pending or streaming AI insight
+
+#--- Rerun Budget Configuration ---
+COLD_START_BUDGET = 4.0   # seconds the first run of a server process may take (measured 1.1-1.3s, 3.4s with cold imports)
+WARM_RERUN_BUDGET = 0.5   # seconds any later rerun may take (measured 0.04-0.07s home, 0.015s journal on a 3-year journal)
+LOGO_PATH = "MindScribe_logo.jpg"
+STYLE_PATH = "style.css"
+
+logger = logging.getLogger(__name__)
+_rerun_started = time.perf_counter()
+begin_rerun()
 
 if "ai_response" not in st.session_state:
     st.session_state.ai_response = ""
@@ -58,203 +58,79 @@ if "ai_response" not in st.session_state:
 if "entry_saved" not in st.session_state:
     st.session_state.entry_saved = False
 
-
-def hash_password(password):
-    """Hashes a password using SHA-256 for secure storage."""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def register_user(username, password):
-    """Registers a new user and returns their user ID."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+#--- One-Time Setup ---
+#Everything here runs once per server process rather than on every rerun
+@st.cache_resource
+def bootstrap():
+    """Migrates the database, configures the LLM backend and starts the AI workers and database maintenance."""
+    #DB_SHARDS > 0 places new users' journals in that many shard files
+    configure_database(shard_count=st.secrets.get("DB_SHARDS"))
+    init_db()
+    #LLM_BACKEND = "http" plus LLM_API_URL points the app at another
+    #chat-completions endpoint, e.g. the bundled mock_llm_server.py
+    configure_llm(
+        backend=st.secrets.get("LLM_BACKEND"),
+        api_url=st.secrets.get("LLM_API_URL"),
+        api_key=st.secrets["OPENAI_API_KEY"],
+    )
+    #limits shared by every session and server process on this machine
+    configure_admission(
+        max_concurrent=st.secrets.get("LLM_MAX_CONCURRENT"),
+        calls_per_second=st.secrets.get("LLM_CALLS_PER_SECOND"),
+    )
+    start_workers()
+    #ARCHIVE_AFTER_MONTHS and BACKUP_DIR turn on the nightly archival and backups
+    configure_maintenance(
+        archive_after_months=st.secrets.get("ARCHIVE_AFTER_MONTHS"),
+        backup_dir=st.secrets.get("BACKUP_DIR"),
+    )
+    start_maintenance()
+    #METRICS_PORT serves Prometheus metrics on http://127.0.0.1:<port>/metrics
+    if st.secrets.get("METRICS_PORT"):
+        start_metrics_server(int(st.secrets["METRICS_PORT"]))
+    return time.perf_counter()
+
+@st.cache_resource
+def load_css():
+    """Reads the app stylesheet from disk once."""
+    with open(STYLE_PATH, encoding="utf-8") as f:
+        return f.read()
+
+@st.cache_resource
+def load_logo():
+    """Reads the logo image once. Returns None if the file is missing."""
     try:
-        hashed_password = hash_password(password)
-        cursor.execute("INSERT INTO users (username, password) Values (?, ?)", (username, hashed_password))
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
-        return user_id, None
-    except sqlite3.IntegrityError:
-        conn.close()
-        return None, "An account with this username already exists."
-
-def login_user(username, password):
-    """Logs in a user and returns their user ID if credentials are correct."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    hashed_password = hash_password(password)
-    cursor.execute("SELECT id FROM users WHERE username=? AND password=?", (username, hashed_password))
-    user = cursor.fetchone()
-    conn.close()
-    return user[0] if user else None
-
-def get_username(user_id):
-    """Fetches the username for a given user ID."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT username FROM users WHERE id=?", (user_id,))
-    username = cursor.fetchone()
-    conn.close()
-    return username[0] if username else None
-
-def set_security_key(user_id, passcode):
-    """Sets a security passcode for a user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET passcode = ? WHERE id = ?", (passcode, user_id))
-    conn.commit()
-    conn.close()
-
-def get_user_passcode(user_id):
-    """Retrieves the security passcode for a user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT passcode FROM users WHERE id = ?", (user_id,))
-    passcode = cursor.fetchone()
-    conn.close()
-    return passcode[0] if passcode else None
-
-def get_last_entry_and_ai_response(user_id):
-    """Fetches the last journal entry and its AI response for a given user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT content, ai_response FROM entries WHERE user_id=? ORDER BY id  DESC LIMIT 1", (user_id, ))
-    entry = cursor.fetchone()
-    conn.close()
-    return entry
-
-def save_entry(user_id, content, mood, ai_response):
-    """saves a new journal entry amd the AI response for the current user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    date_str = datetime.date.today().isoformat()
-    cursor.execute("INSERT INTO entries (user_id, date, content, mood, ai_response) VALUES (?, ?, ?, ?, ?)", (user_id, date_str, content, mood, ai_response))
-    conn.commit()
-    update_streak(user_id, date_str)
-    conn.close()
-
-def delete_entry(entry_id):
-    """Deletes a journal entry by its ID."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM entries WHERE id =?", (entry_id,))
-    conn.commit()
-    conn.close()
-
-def update_streak(user_id, current_date_str):
-    """updates the user's journaling streak."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    current_date = datetime.date.fromisoformat(current_date_str)
-    #check for existing streak
-    cursor.execute("SELECT streak_count, last_entry_date FROM streaks WHERE user_id=?", (user_id,))
-    streak_data = cursor.fetchone()
-    if streak_data:
-        streak_count, last_entry_date_str = streak_data
-        if last_entry_date_str:
-            last_entry_date = datetime.date.fromisoformat(last_entry_date_str)
-            if (current_date - last_entry_date).days == 1:
-                streak_count += 1
-            elif (current_date - last_entry_date).days > 1:
-                streak_count = 1
-        else:
-            streak_count = 1
-        cursor.execute("UPDATE streaks SET streak_count=?, last_entry_date=? WHERE user_id=?", (streak_count, current_date_str, user_id))
-    else:
-        cursor.execute("INSERT into streaks (user_id, streak_count, last_entry_date) VALUES (?, 1, ?)", (user_id, current_date_str))
-    conn.commit()
-    conn.close()
-
-def get_streak(user_id):
-    """Fetches the user's current streak count."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT streak_count FROM streaks WHERE user_id=?", (user_id,))
-    streak = cursor.fetchone()
-    conn.close()
-    return streak[0] if streak else 0
-
-def get_total_entries(user_id):
-    """Fetches the total number of journal entries for a user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM entries WHERE user_id=?", (user_id,))
-    total = cursor.fetchone()
-    conn.close()
-    return total[0] if total else 0
-
-def get_all_entries(user_id):
-    """Fetches all journal entries for a user, ordered by date."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, date, content, mood, ai_response FROM entries WHERE user_id=? ORDER BY date DESC", (user_id,))
-    entries = cursor.fetchall()
-    conn.close()
-    return entries
-
-def get_entry_dates(user_id):
-    """Fetches the dates of all journal entries for a user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT date FROM entries WHERE user_id=? ORDER BY date ASC", (user_id,))
-    dates = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return dates
-
-openai.api_key = st.secrets["OPENAI_API_KEY"]  
-#--- OpenAI API Functions ---
-def generate_ai_response(entry_text):
-    """
-    Generates a creative, personalized AI response based on the journal entry.
-    This function uses the OpenAI API. If the API fails, it provides a fallback message.
-    """
-    fallback_responses = [
-        "Your thoughts are a garden, adn every entry is a seed. Keep nurturing them, and they will blossom into something beautiful.",
-        "Remember that even the most beautiful stories have chapters of quiet moments. Your journey is uniquelyyours, and every page is worth writing.",
-        "Take a deep breath and know that you are capable of incredible things. This moment is just a step on your path.",
-        "Every day is a fresh start, a blank page waiting for your words. Embrace the new beginning."
-    ]
-
-    prompt = f"""
-    You are MindScribe - an AI-powered journal assistant.
-    your mission is to take the user's journal entry and transform it into something that sparks powerful emotions.
-    Choose one of the following formats:
-    - A Poem
-    - A motivational quote
-    - A short humorous dramatic story
-    - A one-act play
-
-    Guidelines:
-    - The response must feel personal and directly inspired by the user's journal entry.
-    - The tone can be motivational (fire-in-the-soul energy), humorous (laugh-out-loud funny), dramatic (mini stage-play), or uplifting (heartwarming).
-    - Make it engaging, creative, and memorable - the kind of response that either makes the user laugh so hard that can't stop, or feel unstoppable motivation to conquer their goals.
-    
-    Here is the journal entry:
-    \"\"\"{entry_text}\"\"\"
-
-    Now, generate a creative response in ONE of the above formats that will either inspire, motivate or bring deep joy to the user.
-    """
-    prompt = textwrap.dedent(prompt)
+        with open(LOGO_PATH, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
 
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a creative, empathetic AI journal assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.8,
-            max_tokens=200
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        st.error(f"AI Error: {e}")
-        return random.choice(fallback_responses)   
+def show_logo():
+    """Shows the MindScribe logo, or fallback text if the image is missing."""
+    logo = load_logo()
+    if logo is not None:
+        st.image(logo, width=150)
+    else:
+        st.markdown('<div style="color: #FFD700; font-size: 3em; font-weight: bold; text-align: center; margin-bottom: 1em;"> MindScribe </div>', unsafe_allow_html=True)
+        st.warning(f"Logo file '{LOGO_PATH}' not found. using fallback text.")
+
+def check_rerun_budget(bootstrapped_at):
+    """Records this rerun's timings and logs a warning when it took longer than its cold-start or warm-rerun budget."""
+    page = st.session_state.get("page")
+    breakdown = end_rerun(page)
+    elapsed = time.perf_counter() - _rerun_started
+    #the run that paid for bootstrap() is the cold start
+    cold = bootstrapped_at >= _rerun_started
+    budget = COLD_START_BUDGET if cold else WARM_RERUN_BUDGET
+    if elapsed > budget:
+        logger.warning("%s rerun of page '%s' took %.3fs (budget %.3fs; db %.3fs, llm %.3fs, ui %.3fs)",
+                       "Cold" if cold else "Warm", page, elapsed, budget, breakdown["db"], breakdown["llm"], breakdown["ui"])
+    return elapsed
 
 #---Streamlit APP UI & Logic ---
         
-#Initialize the database and session state
-init_db()
+#Initialize the database, background AI workers and session state
+bootstrapped_at = bootstrap()
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.user_id = None
@@ -269,113 +145,93 @@ def reset_session():
     st.session_state.logged_in = False
     st.session_state.user_id = None
     st.session_state.page = "login"
+    st.session_state.pop("entry_cursors", None)
+    st.session_state.pop("pending_entry_id", None)
+    st.session_state.pop("calendar_month", None)
+    st.session_state.pop("digest", None)
     st.rerun()
 
 
 #Custom CSS for background, text color, and logo
-st.markdown(
-    """
-    <style>
-    .stApp {
-        background-color: #0b5844;
-        color: white;
-    }
-    .welcome-container {
-        display: flex;
-        flex-direction: column;
-        align-items: center;
-        text-align: center;
-        padding: 2em;
-    }
-    .welcome-title {
-        font-size: 2.5em;
-        font-weight: bold;
-        margin-bottom: 1em;
-    }
-    .welcome-subtitle {
-        font-size: 1.2em;
-        margin-bottom: 1em;
-    }
-    .stButton > button {
-        background-color: #FFD700;
-        color: #0b5844;
-        font-weight: bold;
-        border-radius: 10px;
-        border: none;
-        padding: 10px 20px;
-    }
-    .stSidebar {
-        background-color: #90e8d7;
-        color: white;
-    }
-    .centered-container {
-        display: flex;
-        flex-direction: column;
-        align-items: center;
-        text-align: center;
-        padding: 1em;
-        border: 2px solid #2b2b29;
-        border-radius: 10px;
-        margin-bottom: 1em;
-    }
-    .popup-container {
-        position: fixed;
-        top: 50%;
-        left: 50%;
-        transform: translate(-50%, -50%);
-        background-color: #90e8d7;
-        color: white;
-        padding: 2em;
-        border-radius: 15px;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.5);
-        z-index: 1000;
-        text-align: center;
-    }
-    .calendar {
-        display: grid;
-        grid-template-columns: repeat(7, 1fr);
-        gap:5px;
-        width: 100%;
-        max-width: 600px;
-        margin: auto;
-    }
-    .calendar-day {
-        background-color: #0d4a3e;
-        color: white;
-        padding: 10px;
-        border-radius: 8px;
-        text-align: center;
-    }
-    .calendar-header {
-        grid-column: 1 / -1;
-        text-align: center;
-        font-size: 1.5em;
-        font-weight: bold;
-        margin-bottom: 10px;
-    }
-    .day-name {
-        font-weight: bold;
-        color: #FFD700;
-    }
-    .journaled-day {
-        background-color: #FFD700;
-        color: #0b5844;
-        font-weight: bold;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
     
 
+#--- Dashboard Fragments ---
+#Each dashboard section is a fragment: using a widget inside it reruns only
+#that section and its queries instead of the whole page
+DASHBOARD_FRAGMENTS = ("metrics", "trends", "calendar", "entries")
+
+def dashboard_fragment(name, keyed=True):
+    """Turns a dashboard section into a fragment (rerunnable by name if keyed), timing its solo reruns."""
+    def decorator(func):
+        @functools.wraps(func)
+        def section(*args, **kwargs):
+            with fragment_rerun(f"home:{name}"):
+                return func(*args, **kwargs)
+        return st.fragment(section, key=name if keyed else None)
+    return decorator
+
+def delete_and_refresh(entry_id):
+    """Deletes an entry, then reruns just the dashboard sections that show it or count it."""
+    delete_entry(entry_id)
+    st.session_state.entry_deleted = True
+    st.rerun(list(DASHBOARD_FRAGMENTS))
+
+@dashboard_fragment("entry", keyed=False)
+def show_entry(entry_id, date_str, mood, preview, key_prefix="entry"):
+    """Renders one entry as an expander; its full text is only loaded while it is open."""
+    with st.expander(f"**{date_str}** - Mood: {mood}", key=f"{key_prefix}_{entry_id}", on_change="rerun") as entry_expander:
+        if not entry_expander.open:
+            st.caption(preview)
+            return
+        entry = get_entry(st.session_state.user_id, entry_id)
+        if entry is None:
+            return
+        content, ai_response = entry
+        st.write(f"**My thoughts:**")
+        st.write(content)
+        show_related_entries(st.session_state.user_id, content, exclude={entry_id})
+        st.write("---")
+        st.write(f"**Your AI Insight:**")
+        if ai_response is None:
+            st.write("*Your AI insight is still being written...* ✍️")
+        else:
+            st.write(ai_response)
+        #delete button
+        st.button("delete this entry", key=f"{key_prefix}_delete_{entry_id}", on_click=delete_and_refresh, args=(entry_id,))
+
+def show_related_entries(user_id, text, exclude=()):
+    """Lists the user's past entries most similar to text as short captions."""
+    matches = related_entries(user_id, text, exclude=exclude)
+    if not matches:
+        return
+    st.write("**Similar past entries:**")
+    for entry_id, date_str, mood, snippet in get_entry_summaries(user_id, tuple(entry_id for entry_id, _ in matches)):
+        st.caption(f"**{date_str}** - Mood: {mood} — {snippet}…")
+
+def show_export_import(user_id):
+    """Renders the sidebar controls for downloading and importing a journal."""
+    fmt = st.radio("Format", FORMATS, horizontal=True, key="export_format", format_func=lambda f: {"jsonl": "JSON Lines", "csv": "CSV"}[f])
+    def build_export():
+        #runs on its own thread when the button is clicked, not on every rerun
+        out = io.StringIO()
+        export_journal(user_id, out, fmt)
+        return out.getvalue()
+    st.download_button("Download my journal", data=build_export, file_name=f"mindscribe-journal.{fmt}", mime="text/csv" if fmt == "csv" else "application/jsonl", use_container_width=True)
+    upload = st.file_uploader("Import entries", type=list(FORMATS), key="import_file")
+    if upload is not None and st.button("Import", key="import_button", use_container_width=True):
+        try:
+            count = import_journal(user_id, io.TextIOWrapper(upload, encoding="utf-8", newline=""), format_from_name(upload.name))
+        except (ValueError, UnicodeDecodeError) as e:
+            st.error(f"Nothing was imported: {e}")
+            return
+        notify_workers()
+        st.session_state.pop("entry_cursors", None)
+        st.success(f"Imported {count} entries!! 🎉")
+
 def show_login_page():
     """Renders the login and registration UI."""
-    logo_image_path = "MindScribe_logo.jpg"
-    try:
-        st.image(logo_image_path, width=150)
-    except FileNotFoundError:
-        st.markdown('<div style="color: #FFD700; font-size: 3em; font-weight: bold; text-align: center; margin-bottom: 1em;"> MindScribe </div>', unsafe_allow_html=True)
-        st.warning(f"Logo file '{logo_image_path}' not found. using fallback text.")
+    show_logo()
         
     st.title("Welcome to MindScribe")
     st.subheader("Your AI-Powered Journal")
@@ -411,12 +267,7 @@ def show_login_page():
 
 def show_set_security_key_page():
     """Renders the security key setup UI."""
-    logo_image_path = "MindScribe_logo.jpg"
-    try:
-        st.image(logo_image_path, width=150)
-    except FileNotFoundError:
-        st.markdown('<div style="color: #FFD700; font-size: 3em; font-weight: bold; text-align: center: margin-bottom: 1em;"> MindScribe </div>', unsafe_allow_html=True)
-        st.warning(f"Logo file '{logo_image_path}' not found. Using fallback text.")
+    show_logo()
         
     st.title("Set a Security Key")
     st.write("Optional: Add a 4-digit key to project your journal entries.")
@@ -438,12 +289,7 @@ def show_set_security_key_page():
 
 def show_security_check_page():
     """Renders the security key check UI."""
-    logo_image_path = "MindScribe_logo.jpg"
-    try:
-        st.image(logo_image_path, width=150)
-    except FileNotFoundError:
-        st.markdown('<div style="color: #FFD700; font-size: 3em; font-weight: bold; text-align: center; margin-bottom: 1em;">MindScribe</div>', unsafe_allow_html=True)
-        st.warning(f"Logo file '{logo_image_path}' not found. Using fallback text.")
+    show_logo()
 
     st.title("Enter your Security Key")
     st.write("Please enter your personal key to unlock you journal.")
@@ -461,12 +307,7 @@ def show_security_check_page():
 
 def show_welcome_page():
     """A simple welcome page to show after successful login."""
-    logo_image_path = "MindScribe_logo.jpg"
-    try:
-        st.image(logo_image_path, width=150)
-    except FileNotFoundError:
-        st.markdown('<div style="color: #FFD700; font-size: 3em; font-weight: bold; text-align: center; margin-bottom: 1em;">MindScribe</div>', unsafe_allow_html=True)
-        st.warning(f"Logo file '{logo_image_path}' not found. Using fallback text.")
+    show_logo()
 
     username = get_username(st.session_state.user_id)
     slogans = [
@@ -495,18 +336,11 @@ def show_welcome_page():
     st.write(f"Your User ID is: AIMS **{st.session_state.user_id}**")
     st.button("Start Journaling", use_container_width = True, on_click = lambda: st.session_state.update(page="journal"))
 
-def show_home_page():
-    """Renders the new home page dashboard.."""
-    logo_image_path = "MindScribe_logo.jpg"
-    try:
-        st.image(logo_image_path, width = 150)
-    except FileNotFoundError:
-        st.markdown('<div style= "color: #FFD700; font-size: 3em; font-weight: bold; text-align: center; margin-bottom: 1em; "> MindScribe </div>', unsafe_allow_html = True)
-        st.warning(f"Logo file '{logo_image_path}' not found. Using fallback text.")
-    st.title("Your Journal Dashboard..")
-    st.write("A Quick Look At Your Progress...")
-    #display key metrics
+@dashboard_fragment("metrics")
+def show_dashboard_metrics():
+    """Renders the streak and total-entries cards."""
     current_streak = get_streak(st.session_state.user_id)
+    longest_streak = get_longest_streak(st.session_state.user_id)
     total_entries = get_total_entries(st.session_state.user_id)
     col1, col2 = st.columns(2)
     with col1:
@@ -515,6 +349,7 @@ def show_home_page():
             <div class = "centered-container">
                 <h3> Current Streak </h3>
                 <h2> <span style = "color: #FFD700;"> {current_streak} </span> days 🔥 </h2>
+                <p> Longest: {longest_streak} days </p>
             </div>
             """,
             unsafe_allow_html = True
@@ -529,87 +364,219 @@ def show_home_page():
             """,
             unsafe_allow_html = True
         )
-    st.markdown("---")
-    #Calendar View
+
+def show_bar_chart(rows, x, y, color = None, x_title = None, y_title = None, height = None):
+    """Renders a bar chart from a plain Vega-Lite spec, in the order of rows.
+
+    st.bar_chart builds and schema-validates an Altair chart on every rerun,
+    which was most of a warm dashboard rerun.
+    """
+    encoding = {
+        "x": {"field": x, "type": "ordinal", "title": x_title, "sort": None},
+        "y": {"field": y, "type": "quantitative", "title": y_title},
+        "tooltip": [{"field": x}, {"field": y}],
+    }
+    if color:
+        encoding["color"] = {"field": color, "type": "nominal", "title": color.title()}
+        encoding["tooltip"].insert(1, {"field": color})
+    spec = {"data": {"values": rows}, "mark": {"type": "bar"}, "encoding": encoding}
+    if height:
+        spec["height"] = height
+    st.vega_lite_chart(spec = spec, width = "stretch")
+
+@dashboard_fragment("trends")
+def show_mood_trends():
+    """Renders the mood trend charts, served from the rollup tables."""
+    st.subheader("Your Mood Trends")
+    trend_period = st.radio("Group by", ["week", "month"], horizontal = True, key = "trend_period", format_func = str.title)
+    trends = get_mood_trends(st.session_state.user_id, trend_period)
+    if trends:
+        mood_rows = [{"period": period_start, "mood": mood, "entries": entry_count} for period_start, mood, entry_count in trends]
+        show_bar_chart(mood_rows, "period", "entries", color = "mood", x_title = f"{trend_period.title()} starting", y_title = "Entries")
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            weekday_counts = get_weekday_counts(st.session_state.user_id)
+            weekday_rows = [{"day": day, "entries": count} for day, count in zip(["Mon","Tue","Wed","Thu","Fri","Sat","Sun"], weekday_counts)]
+            show_bar_chart(weekday_rows, "day", "entries", x_title = None, y_title = "Entries", height = 220)
+        with col2:
+            st.markdown(
+                f"""
+                <div class = "centered-container">
+                    <h3> Average Entry </h3>
+                    <h2> <span style = "color: #FFD700;"> {get_average_entry_length(st.session_state.user_id):.0f} </span> chars ✍️ </h2>
+                </div>
+                """,
+                unsafe_allow_html = True
+            )
+    else:
+        st.info("Your mood trends will appear here once you start journaling.")
+
+def shift_calendar_month(step):
+    """Moves the dashboard calendar one month back (-1) or forward (+1)."""
+    year, month = st.session_state.calendar_month
+    month += step
+    st.session_state.calendar_month = (year + (month - 1) // 12, (month - 1) % 12 + 1)
+
+@dashboard_fragment("calendar")
+def show_calendar():
+    """Renders the month grid with journaled days highlighted."""
     st.subheader("Your Calendar")
-    entry_dates = get_entry_dates(st.session_state.user_id)
-    entry_dates_dt = [datetime.date.fromisoformat(d) for d in entry_dates]
     today = datetime.date.today()
-    first_day = today.replace(day=1)
-    days_in_month = (today.replace(month=today.month % 12 + 1, day=1) - datetime.timedelta(days=1)).day
+    if "calendar_month" not in st.session_state:
+        st.session_state.calendar_month = (today.year, today.month)
+    year, month = st.session_state.calendar_month
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        st.button("◀", key="calendar_prev", use_container_width = True, on_click=shift_calendar_month, args=(-1,))
+    with col2:
+        st.markdown(f"<div style='text-align: center; font-weight: bold;'>{calendar.month_name[month]} {year}</div>", unsafe_allow_html=True)
+    with col3:
+        st.button("▶", key="calendar_next", use_container_width = True, on_click=shift_calendar_month, args=(1,))
+    journaled_days = get_journaled_days(st.session_state.user_id, year, month)
+    start_weekday, days_in_month = calendar.monthrange(year, month)  # Monday=0
     weekdays = ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"]
-    cols = st.columns(7)
-    for i, day_name in enumerate(weekdays):
-        cols[i].markdown(f"**{day_name}**")
     calendar_days = []
-    start_weekday = first_day.weekday()  # Monday=0
     for _ in range(start_weekday):
-        calendar_days.append("")
+        calendar_days.append("<td></td>")
     for day in range(1, days_in_month + 1):
-        current_date = first_day.replace(day=day)
-        if current_date in entry_dates_dt:
-            calendar_days.append(f"📝 {day}")  # Highlight journaled day 
+        if day in journaled_days:
+            calendar_days.append(f"<td class='journaled'>📝 {day}</td>")  # Highlight journaled day
         else:
-            calendar_days.append(str(day))
+            calendar_days.append(f"<td>{day}</td>")
+    #one table rather than a row of columns per week: a grid of 49 elements was the slowest part of a rerun
+    rows = ["<tr>" + "".join(f"<th>{day_name}</th>" for day_name in weekdays) + "</tr>"]
     for i in range(0, len(calendar_days), 7):
-        week = calendar_days[i:i+7]
-        cols = st.columns(7)
-        for j, day in enumerate(week):
-            if "📝" in day:
-                cols[j].markdown(f"<span style='color:#FFD700; font-weight:bold;'>{day}</span>", unsafe_allow_html=True)
-            else:
-                cols[j].markdown(day)
+        rows.append("<tr>" + "".join(calendar_days[i:i+7]) + "</tr>")
+    st.markdown(f"<table class='journal-calendar'>{''.join(rows)}</table>", unsafe_allow_html=True)
 
-    st.markdown("---")
-    #Previous entries list with delete option
+@dashboard_fragment("digest")
+def show_digest():
+    """Renders the Week in Review / Year in Review buttons and the digest last asked for."""
+    st.subheader("Looking Back")
+    col1, col2 = st.columns(2)
+    with col1:
+        week_clicked = st.button("Week in Review", use_container_width = True)
+    with col2:
+        year_clicked = st.button("Year in Review", use_container_width = True)
+    if week_clicked or year_clicked:
+        #generated on a background thread; usually precomputed overnight by `digest.py batch`, so only new entries are summarised
+        st.session_state.digest = start_digest(st.session_state.user_id, "week" if week_clicked else "year")
+    if "digest" in st.session_state:
+        digest_key = st.session_state.digest
+        period = digest_key[1]
+        progress = get_digest_progress(digest_key)
+        #shown inline: it stays in session state across reruns, so an overlay would keep covering the dashboard
+        with st.container(border = True):
+            if progress is None:
+                #the server restarted since it was asked for
+                st.info("Your review was interrupted.. Please ask for it again!!")
+            elif not progress["finished"]:
+                show_digest_progress(digest_key)
+            elif progress["error"]:
+                st.error(f"AI Error: {progress['error']}")
+            elif progress["digest"] is None:
+                st.info(f"You haven't journaled in the past {period} yet.. Your review will appear here once you do!!")
+            else:
+                st.markdown(f"### Your {period.title()} in Review")
+                st.markdown(f"*{progress['digest']}*")
+            st.button("Close", key = "digest_close", on_click = close_digest)
+
+def close_digest():
+    """Hides the digest and drops its background state."""
+    forget_digest(st.session_state.pop("digest", None))
+
+@st.fragment(run_every=AI_POLL_INTERVAL)
+def show_digest_progress(digest_key):
+    """Polls a digest being generated in the background, showing how far it got, until it is ready."""
+    progress = get_digest_progress(digest_key)
+    if progress is None or progress["finished"]:
+        #a keyed rerun of just the digest section is only allowed from a callback
+        st.rerun()
+    done, total = progress["done"], progress["total"]
+    st.progress(done / total if total else 0.0, text = f"Looking back over your {digest_key[1]}... ({done} of {total or '?'} parts summarised)")
+
+@dashboard_fragment("entries")
+def show_entry_list():
+    """Renders journal search and the paged list of previous entries."""
+    if st.session_state.pop("entry_deleted", False):
+        st.success("Entry deleted successfully!! 🎉")
+    #Search across entries and AI insights
+    search_text = st.text_input("🔍 Search your journal", key="entry_search", placeholder="e.g. beach, promotion, grandma...")
+    if search_text.strip():
+        results = search_entries(st.session_state.user_id, search_text)
+        if results:
+            for entry_id, date_str, mood, content_snippet, ai_snippet in results:
+                #show whichever field the words were found in
+                snippet = content_snippet if "**" in content_snippet or not ai_snippet or "**" not in ai_snippet else f"AI Insight: {ai_snippet}"
+                show_entry(entry_id, date_str, mood, snippet, key_prefix="search")
+        else:
+            st.info("No entries match your search.")
+        st.markdown("---")
+    #Previous entries list with delete option, one keyset page at a time
     st.subheader("Previous Entries")
-    entries = get_all_entries(st.session_state.user_id)
-    if entries:
-        for entry in entries:
-            entry_id, date_str, content, mood, ai_response = entry
-            with st.expander(f"**{date_str}** - Mood: {mood}"):
-                st.write(f"**My thoughts:**")
-                st.write(content)
-                st.write("---")
-                st.write(f"**Your AI Insight:**")
-                st.write(ai_response)
-                #delete button
-                if st.button("delete this entry", key=f"delete_{entry_id}"):
-                    delete_entry(entry_id)
-                    st.success("Entry deleted successfully!! 🎉")
-                    st.rerun()
+    if "entry_cursors" not in st.session_state:
+        st.session_state.entry_cursors = [None]
+    cursors = st.session_state.entry_cursors
+    headers = get_entry_headers(st.session_state.user_id, before=cursors[-1])
+    while not headers and len(cursors) > 1:
+        #the page emptied out (e.g. its last entry was deleted), step back
+        cursors.pop()
+        headers = get_entry_headers(st.session_state.user_id, before=cursors[-1])
+    if headers:
+        for entry_id, date_str, mood, snippet in headers:
+            show_entry(entry_id, date_str, mood, snippet)
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(cursors) > 1:
+                st.button("Newer entries", use_container_width = True, on_click=cursors.pop)
+        with col2:
+            last_id, last_date = headers[-1][0], headers[-1][1]
+            if len(headers) == ENTRY_PAGE_SIZE:
+                st.button("Older entries", use_container_width = True, on_click=cursors.append, args=((last_date, last_id),))
     else:
         st.info("You don't have any past entries yet.. GoAhead journal one!!")
+
+def show_home_page():
+    """Renders the new home page dashboard.."""
+    show_logo()
+    st.title("Your Journal Dashboard..")
+    st.write("A Quick Look At Your Progress...")
+    show_dashboard_metrics()
+    st.markdown("---")
+    show_mood_trends()
+    st.markdown("---")
+    show_calendar()
+    st.markdown("---")
+    show_digest()
+    st.markdown("---")
+    show_entry_list()
     st.markdown("---")
     #New Journaal Entry Button
     st.button("Write New Entry", use_container_width = True, on_click=lambda: st.session_state.update(page = "journal"))
-    #LogOut button in the sidebar
+    #Export/import and LogOut button in the sidebar
+    with st.sidebar.expander("Export / Import"):
+        show_export_import(st.session_state.user_id)
     if st.sidebar.button("Log Out "):
         reset_session()
 
 
 def show_journal_page():
     """Renders the main journaling page with AI sidebar."""
-    logo_image_path = "MindScribe_logo.jpg"
-    try:
-        st.image(logo_image_path, width=150)
-    except FileNotFoundError:
-        st.markdown('<div style="color: #FFD700; font-size: 3em; font-weight: bold; text-align: center; margin-bottom: 1em;">MindScribe</div>', unsafe_allow_html=True)
-        st.warning(f"Logo file '{logo_image_path}' not found. Using fallback text.")
+    show_logo()
     st.title("Journal Entry")
     st.write("Write about your day and we'll help you reflect on it.")
     journal_entry = st.text_area("What's on your mind today?", height=300)
     mood = st.selectbox("How are you feeling ?", ["Happy", "Sad", "Anxious", "Neutral", "Excited"])
+    if journal_entry:
+        show_related_entries(st.session_state.user_id, journal_entry)
     
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Save Entry", use_container_width = True):
             if journal_entry:
-                with st.spinner('Generating your personalized AI insight...'):
-                    ai_response = generate_ai_response(journal_entry)
-                save_entry(st.session_state.user_id, journal_entry, mood, ai_response)
-                st.session_state.entry_saved = True
-                st.session_state.ai_response = ai_response
+                #save right away, the AI insight is written in the background
+                st.session_state.pending_entry_id = save_entry(st.session_state.user_id, journal_entry, mood)
+                notify_workers()
                 st.rerun()
             else:
                 st.session_state.entry_saved = False
@@ -630,8 +597,32 @@ def show_journal_page():
                 unsafe_allow_html  = True
             )
             st.session_state.entry_saved = False
+    elif st.session_state.get("pending_entry_id"):
+        show_pending_ai_response()
     if st.sidebar.button("Log Out"):
         reset_session()
+
+@st.fragment(run_every=AI_POLL_INTERVAL)
+def show_pending_ai_response():
+    """Polls for the AI insight of the entry just saved and shows it once it is ready."""
+    ai_status = get_ai_status(st.session_state.pending_entry_id)
+    if ai_status is None:
+        #the entry was deleted before its insight arrived
+        st.session_state.pending_entry_id = None
+        st.rerun()
+    ai_response, partial_response = ai_status[1], ai_status[2]
+    if ai_response is None:
+        if partial_response:
+            #show the streamed text so far with a typing cursor
+            st.markdown("### Your AI Insight")
+            st.markdown(f"*{partial_response}* ▌")
+        else:
+            st.info("Your entry is saved! Your personalized AI insight is being written... ✍️")
+        return
+    st.session_state.pending_entry_id = None
+    st.session_state.ai_response = ai_response
+    st.session_state.entry_saved = True
+    st.rerun()
                 
 
 def main_app():
@@ -648,4 +639,14 @@ def main_app():
         show_home_page()
     elif st.session_state.page == "journal":
         show_journal_page()
-main_app()
+
+#Opening the app with ?profile=1 captures the next rerun with cProfile
+profile_requested = st.query_params.get("profile") == "1"
+if profile_requested:
+    del st.query_params["profile"]
+try:
+    with profile_rerun(profile_requested, label=f"rerun-{st.session_state.get('page')}"):
+        main_app()
+finally:
+    #st.rerun() leaves main_app through an exception, and that rerun still counts
+    check_rerun_budget(bootstrapped_at)
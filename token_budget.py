@@ -0,0 +1,80 @@
+import re
+import threading
+from collections import Counter
+
+#--- Token Budget Configuration ---
+INPUT_TOKEN_BUDGET = 1200   # entry tokens sent to the model; longer entries are condensed first
+CHARS_PER_TOKEN = 4         # rough size of a token in English text
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have he her him his i i'm i've if in into is it its "
+    "just me my of on or our she so that the their them then there they this to too was we were what "
+    "when which who will with would you your".split()
+)
+
+_stats = {"entries": 0, "condensed": 0, "tokens_in": 0, "tokens_sent": 0}
+_lock = threading.Lock()
+
+#--- Token Budget Functions ---
+def estimate_tokens(text):
+    """Estimates how many model tokens a text takes, without a tokenizer."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _sentences(text):
+    """Splits text into sentences, treating line breaks as boundaries too."""
+    return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+|\n+", text) if sentence.strip()]
+
+def _words(text):
+    """Returns the lowercase words of a text."""
+    return re.findall(r"[a-z']+", text.lower())
+
+def _truncate(text, budget):
+    """Cuts text to roughly budget tokens, at a word boundary where possible."""
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut + "…"
+
+def condense_text(text, budget=INPUT_TOKEN_BUDGET):
+    """Shortens text to fit a token budget by keeping its most representative sentences.
+
+    Sentences are scored by how often their words recur across the whole
+    text, so the themes the writer keeps returning to survive. The first and
+    last sentences are always kept, and the kept sentences stay in order.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    sentences = _sentences(text)
+    if len(sentences) <= 2:
+        return _truncate(text, budget)
+    frequencies = Counter(word for word in _words(text) if word not in STOPWORDS)
+    def score(sentence):
+        words = [word for word in _words(sentence) if word not in STOPWORDS]
+        return sum(frequencies[word] for word in words) / len(words) if words else 0.0
+    keep = {0, len(sentences) - 1}
+    used = estimate_tokens(sentences[0]) + estimate_tokens(sentences[-1])
+    for index in sorted(range(1, len(sentences) - 1), key=lambda i: score(sentences[i]), reverse=True):
+        cost = estimate_tokens(sentences[index]) + 1
+        if used + cost <= budget:
+            keep.add(index)
+            used += cost
+    condensed = " ".join(sentences[index] for index in sorted(keep))
+    return _truncate(condensed, budget)
+
+def fit_to_budget(text, budget=INPUT_TOKEN_BUDGET):
+    """Returns text condensed to the budget if needed, counting the tokens saved."""
+    fitted = condense_text(text, budget)
+    tokens_in, tokens_sent = estimate_tokens(text), estimate_tokens(fitted)
+    with _lock:
+        _stats["entries"] += 1
+        _stats["condensed"] += fitted is not text
+        _stats["tokens_in"] += tokens_in
+        _stats["tokens_sent"] += tokens_sent
+    return fitted
+
+def get_token_stats():
+    """Returns counters of entries seen and condensed and of tokens before and after condensing."""
+    with _lock:
+        stats = dict(_stats)
+    stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_sent"]
+    return stats